@@ -0,0 +1,249 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from dedupe import DedupeIndex
+from http_client import ApiError
+from response_cache import ResponseCache
+from budget import ByteBudget
+from main import backup_album, backup_album_fanout, add_cache_args, \
+    add_metrics_args, add_size_args, add_upload_mode_arg, write_metrics, \
+    DEFAULT_ALBUM_WORKERS
+from metrics import get_metrics
+from sync_state import SyncState, DEFAULT_STATE_PATH, TARGET_PC, \
+    TARGET_YANDEX
+from vk import VK, ALL_PHOTOS, SIZE_POLICY_MAX
+from yandex_disk import YandexDisk, UPLOAD_MODE_AUTO
+
+load_dotenv()
+
+DEFAULT_JOB_WORKERS = 4
+ALL_ALBUMS = "all"
+# коды завершения
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_ERROR = 2
+
+
+def load_jobs(path):
+    """
+    Чтение файла заданий.
+    Файл содержит список заданий (или объект с ключом 'jobs'), например:
+    [{"user_id": "1234567", "albums": ["profile", "wall"],
+      "targets": ["pc", "yandex"], "count": "all", "size": "cap:1280"}]
+    :param path: Путь к JSON файлу заданий.
+    :return: Список заданий.
+    """
+    with open(path, encoding='utf-8') as file:
+        jobs = json.load(file)
+    if isinstance(jobs, dict):
+        jobs = jobs['jobs']
+    return jobs
+
+
+def run_job(job, state, vk_token, yd_token, full_resync=False, dedupe=None,
+            upload_mode=UPLOAD_MODE_AUTO, size_policy=SIZE_POLICY_MAX,
+            budget=None, cache=None, album_workers=DEFAULT_ALBUM_WORKERS):
+    """
+    Выполнение одного задания резервного копирования.
+    Альбомы обрабатываются параллельно. Если альбом нужно сохранить и на
+    ПК, и на Яндекс.Диск, каждая фотография скачивается из VK один раз
+    (backup_album_fanout). В режиме всех альбомов альбомы,
+    не изменившиеся с последнего успешного сохранения (по количеству
+    фотографий и времени изменения), пропускаются без запросов списка
+    фотографий.
+    :param job: Словарь задания.
+    :param state: Объект SyncState.
+    :param vk_token: Токен VK API.
+    :param yd_token: Токен API Яндекс.Диска.
+    :param full_resync: Игнорировать сохраненное состояние.
+    :param dedupe: Индекс содержимого DedupeIndex.
+    :param upload_mode: Режим загрузки на Яндекс.Диск.
+    :param size_policy: Политика выбора размера фотографий, если она не
+                        задана в задании (ключ 'size').
+    :param budget: Бюджет передаваемых данных ByteBudget на весь запуск.
+    :param cache: Кэш ответов VK API ResponseCache.
+    :param album_workers: Количество одновременно обрабатываемых альбомов.
+    :return: Словарь с результатами по каждому альбому и коду завершения.
+    """
+    user_id = str(job['user_id'])
+    result = {'user_id': user_id, 'albums': {}, 'exit_code': EXIT_OK}
+    count_photo = job.get('count', ALL_PHOTOS)
+    targets = job.get('targets', [TARGET_YANDEX])
+
+    def backup_one(album):
+        # ошибка API (например, закрытый системный альбом) записывается
+        # в результат альбома и не прерывает обработку остальных альбомов
+        try:
+            return save_album(album)
+        except ApiError as error:
+            print(f"Альбом '{album['id']}' не сохранен: {error}")
+            return album['id'], {target: {'saved': 0, 'failed': 0,
+                                          'skipped': 0, 'error': str(error)}
+                                 for target in targets}
+
+    def save_album(album):
+        # у каждого альбома свои объекты: VK и YandexDisk хранят
+        # текущий альбом
+        vk = VK(vk_token, user_id, cache=cache)
+        vk.set_size_policy(job.get('size', size_policy))
+        photos_list = vk.iter_album_photos(album['id'], count_photo)
+        album_id = vk.get_album_id()
+        changed = [target for target in targets
+                   if full_resync or not state.is_album_unchanged(
+                       user_id, album_id, target, album.get('size'),
+                       album.get('updated'))]
+        album_result = {target: {'saved': 0, 'failed': 0,
+                                 'skipped': album.get('size') or 0,
+                                 'unchanged': True}
+                        for target in targets if target not in changed}
+        if not changed:
+            print(f"Альбом '{album_id}' не изменился, пропускается.")
+            return album_id, album_result
+        if 'size' in album:
+            # альбом изменился: список фотографий из кэша устарел
+            vk.forget_photos()
+        yd = YandexDisk(yd_token, dedupe=dedupe, upload_mode=upload_mode) \
+            if TARGET_YANDEX in changed else None
+        if len(changed) > 1:
+            # одно скачивание каждой фотографии для обоих мест сохранения
+            album_result.update(backup_album_fanout(
+                user_id, album_id, photos_list, state, yd,
+                full_resync=full_resync, dedupe=dedupe, budget=budget))
+        else:
+            album_result[changed[0]] = backup_album(
+                user_id, album_id, photos_list, changed[0], state, yd=yd,
+                full_resync=full_resync, dedupe=dedupe, budget=budget)
+        for target in changed:
+            if album_result[target]['failed']:
+                # при повторе задания ссылки на фотографии будут новыми
+                vk.forget_photos()
+            elif count_photo == ALL_PHOTOS \
+                    and (budget is None or not budget.exhausted):
+                state.record_album(user_id, album_id, target,
+                                   album.get('size'), album.get('updated'))
+        return album_id, album_result
+
+    try:
+        for target in targets:
+            if target not in {TARGET_PC, TARGET_YANDEX}:
+                raise ValueError(f"Неизвестное место сохранения: {target}")
+        albums = job.get('albums', ALL_ALBUMS)
+        if isinstance(albums, (str, int)) and albums != ALL_ALBUMS:
+            # один альбом, а не строка как список ID
+            albums = [albums]
+        elif albums != ALL_ALBUMS and not isinstance(albums, list):
+            raise ValueError(f"Неверный список альбомов: {albums!r}")
+        vk = VK(vk_token, user_id, cache=cache)
+        vk.get_users_info()
+        if albums == ALL_ALBUMS:
+            # количество фотографий и время изменения должны быть
+            # актуальными, поэтому список альбомов не берется из кэша
+            albums = vk.get_albums(use_cache=False)
+        else:
+            albums = [{'id': album_id} for album_id in albums]
+        with ThreadPoolExecutor(max_workers=max(1, album_workers)) \
+                as executor:
+            for album_id, album_result in executor.map(backup_one, albums):
+                if any(target_result['failed'] or 'error' in target_result
+                       for target_result in album_result.values()):
+                    result['exit_code'] = EXIT_PARTIAL
+                result['albums'][str(album_id)] = album_result
+    except (ApiError, ValueError) as error:
+        result['error'] = str(error)
+        result['exit_code'] = EXIT_ERROR
+    return result
+
+
+def run_jobs(jobs, workers=DEFAULT_JOB_WORKERS, state_path=DEFAULT_STATE_PATH,
+             full_resync=False, dedupe=False, upload_mode=UPLOAD_MODE_AUTO,
+             size_policy=SIZE_POLICY_MAX, byte_budget=None, cache=True,
+             cache_ttls=None, album_workers=DEFAULT_ALBUM_WORKERS):
+    """
+    Параллельное выполнение заданий с ограничением количества
+    одновременно обрабатываемых заданий.
+    :param jobs: Список заданий.
+    :param workers: Количество одновременно выполняемых заданий.
+    :param state_path: Путь к файлу состояния синхронизации.
+    :param full_resync: Игнорировать сохраненное состояние.
+    :param dedupe: Сохранять одинаковые фотографии копиями.
+    :param upload_mode: Режим загрузки на Яндекс.Диск.
+    :param size_policy: Политика выбора размера фотографий.
+    :param byte_budget: Бюджет передачи на все задания в байтах.
+    :param cache: Использовать кэш ответов VK API.
+    :param cache_ttls: Словарь {метод: время жизни ответов в секундах}.
+    :param album_workers: Количество одновременно обрабатываемых альбомов
+                          в одном задании.
+    :return: Список результатов заданий в порядке заданий.
+    """
+    vk_token = os.getenv('VK_TOKEN')
+    yd_token = os.getenv('YD_TOKEN')
+    state = SyncState(state_path)
+    index = DedupeIndex(state_path) if dedupe else None
+    budget = ByteBudget(byte_budget) if byte_budget is not None else None
+    responses = ResponseCache(state_path, cache_ttls) if cache else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(run_job, job, state, vk_token,
+                                       yd_token, full_resync, index,
+                                       upload_mode, size_policy, budget,
+                                       responses, album_workers)
+                       for job in jobs]
+            return [future.result() for future in futures]
+    finally:
+        if index is not None:
+            index.report()
+            index.close()
+        if responses is not None:
+            responses.report()
+            responses.close()
+        state.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Пакетный backup фотографий VK без ввода с клавиатуры. "
+                    "Токены берутся из переменных VK_TOKEN и YD_TOKEN.")
+    parser.add_argument('jobs', help="JSON файл со списком заданий")
+    parser.add_argument('--workers', type=int, default=DEFAULT_JOB_WORKERS,
+                        help="количество одновременно выполняемых заданий")
+    parser.add_argument('--album-workers', type=int,
+                        default=DEFAULT_ALBUM_WORKERS,
+                        help="количество одновременно обрабатываемых "
+                             "альбомов одного задания")
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH,
+                        help="путь к файлу состояния синхронизации")
+    parser.add_argument('--full-resync', action='store_true',
+                        help="игнорировать сохраненное состояние")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="сохранять одинаковые фотографии копиями")
+    parser.add_argument('--report', help="путь для записи JSON отчета")
+    add_size_args(parser)
+    add_upload_mode_arg(parser)
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args(args)
+
+    get_metrics().quiet = args.quiet
+    try:
+        results = run_jobs(load_jobs(args.jobs), args.workers, args.state,
+                           args.full_resync, args.dedupe, args.upload_mode,
+                           args.size_policy, args.byte_budget,
+                           not args.no_cache, dict(args.cache_ttl),
+                           args.album_workers)
+    finally:
+        write_metrics(args)
+    for result in results:
+        print(f"Пользователь {result['user_id']}: "
+              f"код завершения {result['exit_code']}"
+              + (f" ({result['error']})" if 'error' in result else ""))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4, ensure_ascii=False)
+    return max((result['exit_code'] for result in results), default=EXIT_OK)
+
+
+if __name__ == '__main__':
+    exit(main())
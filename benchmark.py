@@ -0,0 +1,362 @@
+import io
+import os
+import re
+import sys
+import json
+import argparse
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+
+from downloader import Downloader, DEFAULT_WORKERS
+from fake_servers import FakeCDN, FakeVK, FakeYandexDisk
+from http_client import HttpClient, AdaptiveLimiter
+from main import download_photos
+from pipeline import run_pipeline
+from vk import VK, ALL_PHOTOS
+from metrics import get_metrics
+from yandex_disk import (YandexDisk, UPLOAD_MODES, UPLOAD_MODE_AUTO,
+                         UPLOAD_MODE_URL)
+
+
+def bench_download(count, photo_size, latency, workers):
+    """
+    Замер пропускной способности скачивания фотографий на диск.
+    :param count: Количество фотографий.
+    :param photo_size: Размер каждой фотографии в байтах.
+    :param latency: Задержка сервера в секундах.
+    :param workers: Количество одновременных загрузок.
+    :return: Количество фотографий в секунду.
+    """
+    server = FakeCDN(photo_size, latency=latency).start()
+    photos_list = [{'url': f"{server.url}/{i}.jpg",
+                    'file_name': f"{i}.jpg"} for i in range(count)]
+    folder = tempfile.mkdtemp()
+    downloader = Downloader(workers, client=HttpClient(rate_limits={}))
+    try:
+        start = time.perf_counter()
+        downloader.download_all(folder, photos_list)
+        elapsed = time.perf_counter() - start
+    finally:
+        downloader.client.close()
+        server.stop()
+        shutil.rmtree(folder)
+    return count / elapsed
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self.status_code = 200
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeVKClient:
+
+    def __init__(self, album_size, latency=0.0):
+        """
+        Имитация VK API для синтетического альбома без обращения к сети.
+        :param album_size: Количество фотографий в альбоме.
+        :param latency: Задержка каждого запроса в секундах.
+        :return: None.
+        """
+        self.album_size = album_size
+        self.latency = latency
+
+    def get_page(self, offset, count):
+        items = [{'id': photo_id,
+                  'likes': {'count': photo_id % 100},
+                  'sizes': [{'type': 's', 'height': 75,
+                             'url': f"https://cdn.test/{photo_id}_s.jpg"},
+                            {'type': 'z', 'height': 1080,
+                             'url': f"https://cdn.test/{photo_id}_z.jpg"}],
+                  }
+                 for photo_id in range(offset,
+                                       min(self.album_size, offset + count))]
+        return {'count': self.album_size, 'items': items}
+
+    def get(self, url, params=None, **kwargs):
+        time.sleep(self.latency)
+        return FakeResponse(
+            {'response': self.get_page(params['offset'], params['count'])})
+
+    def post(self, url, data=None, **kwargs):
+        time.sleep(self.latency)
+        calls = re.findall(r'API\.photos\.get\((\{.*?\})\)', data['code'])
+        pages = [self.get_page(params['offset'], params['count'])
+                 for params in map(json.loads, calls)]
+        return FakeResponse({'response': pages})
+
+
+def bench_pipeline(album_size, latency, streaming):
+    """
+    Замер пиковой памяти и времени до первой загрузки для альбома.
+    :param album_size: Количество фотографий в синтетическом альбоме.
+    :param latency: Задержка запроса к VK API в секундах.
+    :param streaming: Потоковый режим (True) или полный список (False).
+    :return: Пара (время до первой загрузки в секундах,
+             пиковая память в байтах).
+    """
+    vk = VK('token', 1, client=FakeVKClient(album_size, latency))
+    first = []
+
+    def handler(photo):
+        if not first:
+            first.append(time.perf_counter())
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        if streaming:
+            photos = vk.iter_album_photos('profile', ALL_PHOTOS)
+        else:
+            photos = vk.get_album_photos('profile', ALL_PHOTOS)
+        for _ in run_pipeline(photos, handler):
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first[0] - start, peak
+
+
+class TimingClient(HttpClient):
+    """HTTP клиент, запоминающий время выполнения каждого запроса."""
+
+    def __init__(self, **kwargs):
+        super().__init__(rate_limits={}, **kwargs)
+        self.latencies = []
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, percent):
+    """
+    Вычисление перцентиля.
+    :param values: Список значений.
+    :param percent: Перцентиль от 0 до 100.
+    :return: Значение перцентиля или 0 для пустого списка.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def bench_e2e(album_size, photo_size, latency, error_rate, workers,
+              upload_mode=UPLOAD_MODE_AUTO, fetch_error_rate=0.0):
+    """
+    Сквозной замер всех этапов на локальных имитациях VK API,
+    сервера фотографий и Яндекс.Диска.
+    :param album_size: Количество фотографий в альбоме.
+    :param photo_size: Размер каждой фотографии в байтах.
+    :param latency: Задержка ответа серверов в секундах.
+    :param error_rate: Доля ответов 503.
+    :param workers: Количество одновременных загрузок на ПК.
+    :param upload_mode: Режим загрузки на Яндекс.Диск.
+    :param fetch_error_rate: Доля загрузок по URL, завершающихся ошибкой.
+    :return: Список словарей с результатами по этапам.
+    """
+    cdn = FakeCDN(photo_size, latency=latency, error_rate=error_rate)
+    vk_server = FakeVK(cdn.url, {'profile': album_size},
+                       latency=latency, error_rate=error_rate)
+    disk = FakeYandexDisk(fetch_delay=latency,
+                          fetch_error_rate=fetch_error_rate,
+                          latency=latency, error_rate=error_rate)
+    client = TimingClient()
+    folder = tempfile.mkdtemp()
+    phases = []
+
+    def measure(name, servers, run):
+        client.latencies = []
+        requests_before = sum(sum(server.requests.values())
+                              for server in servers)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            result = run()
+        elapsed = time.perf_counter() - start
+        requests = sum(sum(server.requests.values())
+                       for server in servers) - requests_before
+        phases.append({'phase': name,
+                       'photos_per_second': album_size / elapsed,
+                       'requests_per_photo': requests / album_size,
+                       'p50_ms': percentile(client.latencies, 50) * 1000,
+                       'p99_ms': percentile(client.latencies, 99) * 1000})
+        return result
+
+    with cdn, vk_server, disk:
+        vk = VK('token', 1, client=client, api_url=f"{vk_server.url}/method")
+        yd = YandexDisk('token', client=client,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=upload_mode)
+        photos_list = measure('vk_listing', [vk_server], lambda: list(
+            vk.iter_album_photos('profile', ALL_PHOTOS)))
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            measure('download_photos', [cdn], lambda: download_photos(
+                1, 'profile', photos_list, workers, client=client))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(folder)
+        measure('yandex_load_photos', [disk],
+                lambda: yd.load_photos(1, 'profile', photos_list))
+    client.close()
+    return phases
+
+
+def bench_concurrency(count, latency, capacity, limiter, retry_after=None):
+    """
+    Замер отправки фотографий на имитацию Яндекс.Диска, которая
+    обрабатывает ограниченное количество одновременных запросов.
+    :param count: Количество фотографий.
+    :param latency: Задержка ответа сервера без перегрузки в секундах.
+    :param capacity: Количество одновременных запросов без роста задержки.
+    :param limiter: Ограничитель одновременных загрузок AdaptiveLimiter.
+    :param retry_after: Заголовок Retry-After в ответах 503 при перегрузке.
+    :return: Тройка (фотографий в секунду, доля ответов 503,
+             итоговый предел ограничителя).
+    """
+    disk = FakeYandexDisk(latency=latency, capacity=capacity,
+                          retry_after=retry_after)
+    client = HttpClient(rate_limits={})
+    photos_list = [{'url': f"http://127.0.0.1/{i}.jpg",
+                    'file_name': f"{i}.jpg", 'type': 'z'}
+                   for i in range(count)]
+    with disk:
+        yd = YandexDisk('token', client=client,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=UPLOAD_MODE_URL, limiter=limiter)
+        yd.create_folder(1, 'profile')
+        start = time.perf_counter()
+        yd.upload_all_photos(1, 'profile', photos_list)
+        elapsed = time.perf_counter() - start
+        requests = disk.requests['/v1/disk/resources/upload']
+    client.close()
+    rejected = get_metrics().summary()['requests']
+    errors = sum(item['count'] for item in rejected
+                 if item['method'] == 'POST' and item['status'] == '503')
+    return count / elapsed, errors / max(1, requests), limiter.limit
+
+
+# код замера импорта модуля в отдельном процессе
+STARTUP_CODE = """
+import resource, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+STARTUP_MODULES = ['main', 'vk', 'yandex_disk']
+
+
+def bench_startup(module, repeat):
+    """
+    Замер времени импорта модуля и пикового RSS процесса.
+    Каждый замер выполняется в новом интерпретаторе.
+    :param module: Название модуля.
+    :param repeat: Количество замеров.
+    :return: Пара (минимальное время импорта в секундах,
+             максимальный пиковый RSS в КБ).
+    """
+    times, rss = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_CODE.format(module=module)],
+            capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+        rss.append(int(output[1]))
+    return min(times), max(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки backup VK.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    download = commands.add_parser(
+        'download', help="скачивание с локального HTTP сервера")
+    download.add_argument('--count', type=int, default=200)
+    download.add_argument('--size', type=int, default=200 * 1024)
+    download.add_argument('--latency', type=float, default=0.02)
+    download.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    pipeline = commands.add_parser(
+        'pipeline', help="получение списка фотографий и передача в загрузку")
+    pipeline.add_argument('--count', type=int, default=50000)
+    pipeline.add_argument('--latency', type=float, default=0.1)
+    e2e = commands.add_parser(
+        'e2e', help="сквозной замер на локальных имитациях API")
+    e2e.add_argument('--count', type=int, default=500)
+    e2e.add_argument('--size', type=int, default=100 * 1024)
+    e2e.add_argument('--latency', type=float, default=0.01)
+    e2e.add_argument('--error-rate', type=float, default=0.0)
+    e2e.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    e2e.add_argument('--upload-mode', choices=UPLOAD_MODES,
+                     default=UPLOAD_MODE_AUTO)
+    e2e.add_argument('--fetch-error-rate', type=float, default=0.0)
+    concurrency = commands.add_parser(
+        'concurrency', help="подстройка количества одновременных загрузок "
+                            "под ограниченный сервер")
+    concurrency.add_argument('--count', type=int, default=1000)
+    concurrency.add_argument('--latency', type=float, default=0.05)
+    concurrency.add_argument('--capacity', type=int, default=12)
+    concurrency.add_argument('--retry-after', type=float)
+    startup = commands.add_parser(
+        'startup', help="время импорта и пиковый RSS модулей")
+    startup.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'download':
+        for workers in sorted({1, args.workers}):
+            rate = bench_download(args.count, args.size, args.latency,
+                                  workers)
+            print(f"download: workers={workers} {rate:.1f} фото/с")
+    elif args.command == 'pipeline':
+        for streaming in (False, True):
+            first, peak = bench_pipeline(args.count, args.latency, streaming)
+            print(f"pipeline: {'stream' if streaming else 'list':6} "
+                  f"первая загрузка через {first * 1000:.0f} мс, "
+                  f"пик памяти {peak / 2 ** 20:.1f} МБ")
+    elif args.command == 'e2e':
+        for phase in bench_e2e(args.count, args.size, args.latency,
+                               args.error_rate, args.workers,
+                               args.upload_mode, args.fetch_error_rate):
+            print(f"e2e: {phase['phase']:18} "
+                  f"{phase['photos_per_second']:8.1f} фото/с "
+                  f"{phase['requests_per_photo']:6.3f} запросов/фото "
+                  f"p50 {phase['p50_ms']:7.1f} мс "
+                  f"p99 {phase['p99_ms']:7.1f} мс")
+    elif args.command == 'concurrency':
+        best = args.capacity / args.latency
+        get_metrics().quiet = True
+        limiters = [(f"fixed {workers}", AdaptiveLimiter(
+            'fixed', initial=workers, minimum=workers, maximum=workers))
+            for workers in sorted({4, args.capacity, 32})]
+        limiters.append(('adaptive', AdaptiveLimiter(
+            'adaptive', initial=4, maximum=32)))
+        for name, limiter in limiters:
+            with redirect_stdout(io.StringIO()):
+                rate, rejected, limit = bench_concurrency(
+                    args.count, args.latency, args.capacity, limiter,
+                    args.retry_after)
+            get_metrics().requests.clear()
+            print(f"concurrency: {name:9} {rate:7.1f} фото/с "
+                  f"({rate / best:4.0%} от лучшего), "
+                  f"отказов {rejected:5.1%}, предел {int(limit)}")
+    elif args.command == 'startup':
+        for module in STARTUP_MODULES:
+            elapsed, rss = bench_startup(module, args.repeat)
+            print(f"startup: {module:12} импорт {elapsed * 1000:.0f} мс, "
+                  f"пиковый RSS {rss / 1024:.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from downloader import get_content_length
+from http_client import ApiError, get_client
+
+# количество одновременных запросов размеров фотографий
+SIZE_WORKERS = 8
+UNITS = {'': 1, 'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+class ByteBudget:
+
+    def __init__(self, limit, client=None, workers=SIZE_WORKERS):
+        """
+        Инициализация бюджета передаваемых данных на весь запуск.
+        :param limit: Бюджет в байтах.
+        :param client: HTTP клиент, по умолчанию - общий клиент.
+        :param workers: Количество одновременных запросов размеров.
+        :return: None.
+        """
+        self.limit = limit
+        self.spent = 0
+        self.exhausted = False
+        self.client = client or get_client()
+        self.workers = workers
+        self.lock = threading.Lock()
+
+    def take(self, size):
+        """
+        Списание размера фотографии с бюджета.
+        :param size: Размер фотографии в байтах.
+        :return: True, если фотография помещается в остаток бюджета.
+        """
+        with self.lock:
+            if self.exhausted or self.spent + size > self.limit:
+                self.exhausted = True
+                return False
+            self.spent += size
+            return True
+
+    def get_size(self, url):
+        """
+        Получение размера фотографии запросом HEAD.
+        :param url: URL фотографии.
+        :return: Размер в байтах или None, если его узнать не удалось.
+        """
+        try:
+            response = self.client.request('HEAD', url, allow_redirects=True)
+            response.raise_for_status()
+        except (ApiError, requests.RequestException):
+            return None
+        return get_content_length(response)
+
+    def select(self, photos_list):
+        """
+        Отбор фотографий в пределах бюджета. Фотографии ранжируются по
+        количеству лайков (при равенстве - сначала меньшие), отбор
+        прекращается на первой фотографии, которая не помещается в бюджет.
+        Фотографии с неизвестным размером не отбираются и учитываются
+        отдельно: они не сохранены из-за ошибки, а не из-за бюджета.
+        :param photos_list: Список или генератор фотографий.
+        :return: Пара (список отобранных фотографий, список фотографий
+                 с неизвестным размером).
+        """
+        photos_list = list(photos_list)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            sizes = list(executor.map(
+                self.get_size, [photo['url'] for photo in photos_list]))
+        ranked = sorted(
+            ((photo, size) for photo, size in zip(photos_list, sizes)
+             if size is not None),
+            key=lambda pair: (-pair[0]['likes'], pair[1]))
+        unknown = [photo for photo, size in zip(photos_list, sizes)
+                   if size is None]
+        selected = []
+        for photo, size in ranked:
+            if not self.take(size):
+                break
+            selected.append(photo)
+        print(f"Бюджет: отобрано {len(selected)} из {len(photos_list)} "
+              f"фотографий, израсходовано {self.spent} из {self.limit} байт.")
+        if unknown:
+            print(f"Бюджет: не удалось узнать размер {len(unknown)} "
+                  f"фотографий, они не сохранены.")
+        return selected, unknown
+
+
+def parse_byte_size(value):
+    """
+    Разбор размера в байтах с необязательным суффиксом K, M, G или T.
+    :param value: Строка, например '500M' или '1073741824'.
+    :return: Размер в байтах.
+    """
+    match = re.fullmatch(r'(\d+)\s*([KMGT]?)B?', value.strip().upper())
+    if match is None:
+        raise ValueError(f"Неверный размер: {value}")
+    return int(match.group(1)) * UNITS[match.group(2)]
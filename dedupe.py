@@ -0,0 +1,186 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from sync_state import DEFAULT_STATE_PATH
+
+CHUNK_SIZE = 64 * 1024
+# параметры URL, которые выбирают размер и качество фотографии: у VK один
+# путь для всех размеров, остальные параметры (подпись и т.п.) меняются
+# от запроса к запросу
+URL_KEY_PARAMS = {'size', 'quality'}
+
+
+class DedupeIndex:
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        """
+        Инициализация индекса содержимого фотографий: хэш -> сохраненный
+        путь для каждого места сохранения.
+        :param path: Путь к файлу базы данных SQLite.
+        :return: None.
+        """
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS contents (
+                    target TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (target, digest)
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL
+                )""")
+        # статистика дедупликации за запуск
+        self.copies = 0
+        self.bytes_saved = 0
+        self.requests_saved = 0
+
+    def lookup_url(self, url):
+        """
+        Получение хэша содержимого по URL фотографии, если фотография
+        с таким URL уже скачивалась.
+        :param url: URL фотографии.
+        :return: Пара (хэш содержимого, размер) или None.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT digest, size FROM urls WHERE url = ?",
+                (get_url_key(url),)).fetchone()
+
+    def lookup(self, target, digest):
+        """
+        Получение сохраненной копии фотографии с таким же содержимым.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param digest: Хэш содержимого.
+        :return: Пара (путь, размер) или None.
+        """
+        if digest is None:
+            return None
+        with self.lock:
+            return self.connection.execute(
+                "SELECT path, size FROM contents WHERE target = ? "
+                "AND digest = ?", (target, digest)).fetchone()
+
+    def add(self, target, digest, path, size, url=None):
+        """
+        Запись сохраненной фотографии в индекс.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param digest: Хэш содержимого.
+        :param path: Путь к сохраненной фотографии.
+        :param size: Размер фотографии в байтах.
+        :param url: URL фотографии.
+        :return: None.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?)",
+                (target, digest, path, size))
+        if url is not None:
+            self.remember_url(url, digest, size)
+
+    def remember_url(self, url, digest, size):
+        """
+        Запись соответствия URL фотографии и хэша содержимого.
+        :param url: URL фотографии.
+        :param digest: Хэш содержимого.
+        :param size: Размер фотографии в байтах.
+        :return: None.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?)",
+                (get_url_key(url), digest, size))
+
+    def count_copy(self, size, transferred):
+        """
+        Учет фотографии, сохраненной как копия.
+        :param size: Размер фотографии в байтах.
+        :param transferred: True, если фотография все же была скачана
+                            (сэкономлено только место, а не запрос).
+        :return: None.
+        """
+        with self.lock:
+            self.copies += 1
+            self.bytes_saved += size
+            if not transferred:
+                self.requests_saved += 1
+
+    def report(self):
+        """
+        Вывод статистики дедупликации.
+        :return: None.
+        """
+        print(f"Дедупликация: {self.copies} копий, сэкономлено "
+              f"{self.bytes_saved} байт и {self.requests_saved} запросов.")
+
+    def close(self):
+        """
+        Закрытие соединения с базой данных.
+        :return: None.
+        """
+        self.connection.close()
+
+
+def get_url_key(url):
+    """
+    Получение ключа URL фотографии без параметров запроса, которые
+    у VK меняются от запроса к запросу. Параметры выбора размера
+    остаются в ключе, чтобы разные размеры одной фотографии не совпадали.
+    :param url: URL фотографии.
+    :return: Ключ URL.
+    """
+    parts = urlsplit(url)
+    params = sorted((name, value) for name, value in parse_qsl(parts.query)
+                    if name in URL_KEY_PARAMS)
+    key = f"{parts.netloc}{parts.path}"
+    return f"{key}?{urlencode(params)}" if params else key
+
+
+def hash_stream(chunks, hasher=None):
+    """
+    Вычисление хэша SHA-256 для потока данных.
+    :param chunks: Итерируемый поток блоков данных.
+    :param hasher: Объект хэша для продолжения вычисления.
+    :return: Пара (хэш, размер в байтах).
+    """
+    if hasher is None:
+        hasher = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def hash_file(path, hasher=None):
+    """
+    Вычисление хэша SHA-256 файла на диске.
+    :param path: Путь к файлу.
+    :param hasher: Объект хэша для продолжения вычисления.
+    :return: Пара (хэш, размер в байтах).
+    """
+    with open(path, 'rb') as file:
+        return hash_stream(iter(lambda: file.read(CHUNK_SIZE), b''), hasher)
+
+
+def link_file(source, file_path):
+    """
+    Создание жесткой ссылки на файл, а если это невозможно - копии.
+    :param source: Путь к существующему файлу.
+    :param file_path: Путь к новому файлу.
+    :return: None.
+    """
+    try:
+        os.link(source, file_path)
+    except OSError:
+        shutil.copyfile(source, file_path)
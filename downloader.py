@@ -0,0 +1,223 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from dedupe import hash_file, link_file
+from http_client import ApiError, get_client
+from metrics import get_metrics
+from sync_state import TARGET_PC
+
+DEFAULT_WORKERS = 8
+CHUNK_SIZE = 64 * 1024
+# недокачанные фотографии хранятся рядом с итоговым файлом
+PART_SUFFIX = '.part'
+# количество попыток докачать фотографию за один запуск
+RESUME_ATTEMPTS = 3
+
+
+class IncompleteDownload(Exception):
+    """Размер скачанного файла не совпадает с размером на сервере."""
+
+
+class Downloader:
+
+    def __init__(self, workers=DEFAULT_WORKERS, chunk_size=CHUNK_SIZE,
+                 client=None, dedupe=None):
+        """
+        Инициализация объекта для параллельного скачивания фотографий.
+        :param workers: Количество одновременных загрузок.
+        :param chunk_size: Размер блока при записи файла на диск.
+        :param client: HTTP клиент, по умолчанию - общий клиент
+                       с пулом соединений на все потоки.
+        :param dedupe: Индекс содержимого DedupeIndex: одинаковые
+                       фотографии сохраняются жесткими ссылками.
+        :return: None.
+        """
+        self.workers = max(1, int(workers))
+        self.chunk_size = chunk_size
+        self.client = client or get_client()
+        self.dedupe = dedupe
+
+    def get_remote_size(self, url):
+        """
+        Получение размера фотографии на сервере.
+        :param url: URL фотографии.
+        :return: Размер в байтах или None, если сервер его не сообщил.
+        """
+        response = self.client.request('HEAD', url, allow_redirects=True)
+        response.raise_for_status()
+        return get_content_length(response)
+
+    def is_complete(self, url, file_path):
+        """
+        Проверка, что файл на диске скачан полностью.
+        :param url: URL фотографии.
+        :param file_path: Путь к файлу.
+        :return: True, если размер файла совпадает с размером на сервере
+                 или размер на сервере узнать не удалось.
+        """
+        try:
+            remote_size = self.get_remote_size(url)
+        except (ApiError, requests.RequestException):
+            return True
+        return remote_size is None \
+            or os.path.getsize(file_path) == remote_size
+
+    def fetch_part(self, url, part_path):
+        """
+        Скачивание фотографии во временный файл с докачкой (HTTP Range),
+        если временный файл уже есть и сервер поддерживает докачку.
+        :param url: URL фотографии.
+        :param part_path: Путь к временному файлу.
+        :return: Пара (размер скачанного файла в байтах,
+                 хэш SHA-256 содержимого).
+        """
+        offset = os.path.getsize(part_path) \
+            if os.path.exists(part_path) else 0
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        hasher = hashlib.sha256()
+        with self.client.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 416:
+                # временный файл уже содержит всю фотографию
+                if get_total_size(response) == offset:
+                    return offset, hash_file(part_path)[0]
+                os.remove(part_path)
+                raise IncompleteDownload(url)
+            response.raise_for_status()
+            if response.status_code == 206:
+                mode = 'ab'
+                total = get_total_size(response)
+                # хэш считается по всему файлу, включая скачанную ранее часть
+                hash_file(part_path, hasher)
+            else:
+                # сервер не поддерживает докачку, файл качается заново
+                mode = 'wb'
+                offset = 0
+                total = get_content_length(response)
+            size = offset
+            with open(part_path, mode) as file:
+                for chunk in response.iter_content(self.chunk_size):
+                    file.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
+        get_metrics().add_bytes('download', size - offset)
+        if total is not None and size != total:
+            raise IncompleteDownload(url)
+        return size, hasher.hexdigest()
+
+    def download_photo(self, url, file_path):
+        """
+        Потоковое скачивание одной фотографии в файл.
+        Фотография качается во временный файл, который переименовывается
+        в итоговый только после полного скачивания.
+        :param url: URL фотографии.
+        :param file_path: Путь для сохранения фотографии.
+        :return: Пара (количество записанных байт, хэш SHA-256 содержимого).
+        """
+        part_path = file_path + PART_SUFFIX
+        for attempt in range(1, RESUME_ATTEMPTS + 1):
+            try:
+                size, digest = self.fetch_part(url, part_path)
+            except (requests.RequestException, IncompleteDownload):
+                if attempt == RESUME_ATTEMPTS:
+                    raise
+                continue
+            os.replace(part_path, file_path)
+            return size, digest
+
+    def link_copy(self, url, file_path, digest=None):
+        """
+        Сохранение фотографии как жесткой ссылки на уже сохраненную
+        фотографию с таким же содержимым.
+        :param url: URL фотографии.
+        :param file_path: Путь для сохранения фотографии.
+        :param digest: Хэш содержимого, если фотография уже скачана.
+        :return: True, если найдена и создана копия.
+        """
+        transferred = digest is not None
+        if digest is None:
+            known = self.dedupe.lookup_url(url)
+            if known is None:
+                return False
+            digest = known[0]
+        found = self.dedupe.lookup(TARGET_PC, digest)
+        if found is None:
+            return False
+        source, size = found
+        if not os.path.exists(source) or os.path.abspath(source) \
+                == os.path.abspath(file_path):
+            return False
+        if transferred:
+            os.remove(file_path)
+            self.dedupe.remember_url(url, digest, size)
+        link_file(source, file_path)
+        self.dedupe.count_copy(size, transferred)
+        return True
+
+    def download_one(self, folder, photo):
+        """
+        Скачивание фотографии в папку, если ее еще нет на диске.
+        :param folder: Папка для сохранения фотографии.
+        :param photo: Запись о фотографии.
+        :return: Статус: 'downloaded', 'linked' (сохранена копия уже
+                 скачанной фотографии), 'exists' или 'failed'.
+        """
+        file_path = os.path.join(folder, photo['file_name'])
+        # проверка на дублирование фотографий
+        if os.path.exists(file_path):
+            if self.is_complete(photo['url'], file_path):
+                return 'exists'
+            # оборванный файл докачивается как временный
+            os.replace(file_path, file_path + PART_SUFFIX)
+        try:
+            if self.dedupe is None:
+                self.download_photo(photo['url'], file_path)
+                return 'downloaded'
+            # фотография с тем же URL уже скачивалась в другой альбом
+            if self.link_copy(photo['url'], file_path):
+                return 'linked'
+            size, digest = self.download_photo(photo['url'], file_path)
+            if self.link_copy(photo['url'], file_path, digest):
+                return 'linked'
+            self.dedupe.add(TARGET_PC, digest, file_path, size, photo['url'])
+            return 'downloaded'
+        except (ApiError, requests.RequestException, IncompleteDownload,
+                OSError):
+            # временный файл остается для докачки при следующем запуске
+            return 'failed'
+
+    def download_all(self, folder, photos_list):
+        """
+        Параллельное скачивание фотографий в папку.
+        Фотографии, которые уже полностью есть на диске, не скачиваются.
+        :param folder: Папка для сохранения фотографий.
+        :param photos_list: Список фотографий для сохранения.
+        :return: Список статусов по каждой фотографии:
+                 'downloaded', 'exists' или 'failed'.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(
+                lambda photo: self.download_one(folder, photo), photos_list))
+
+
+def get_content_length(response):
+    """
+    Получение размера тела ответа из заголовка Content-Length.
+    :param response: Объект ответа requests.Response.
+    :return: Размер в байтах или None.
+    """
+    value = response.headers.get('Content-Length')
+    return int(value) if value and value.isdigit() else None
+
+
+def get_total_size(response):
+    """
+    Получение полного размера файла из заголовка Content-Range.
+    :param response: Объект ответа requests.Response.
+    :return: Размер в байтах или None.
+    """
+    value = response.headers.get('Content-Range', '')
+    total = value.rsplit('/', 1)[-1]
+    return int(total) if total.isdigit() else None
@@ -0,0 +1,452 @@
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# минимальный заголовок JPEG, остальная часть файла - заполнитель
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'
+# системные альбомы VK: имя, которое принимает photos.get, и ID в ответе
+# photos.getAlbums
+SYSTEM_ALBUMS = {'profile': -6, 'wall': -7, 'saved': -15}
+
+
+def make_jpeg(size):
+    """
+    Создание синтетической фотографии заданного размера.
+    :param size: Размер файла в байтах.
+    :return: Содержимое файла.
+    """
+    return JPEG_HEADER + b'\x00' * max(0, size - len(JPEG_HEADER) - 2) \
+        + b'\xff\xd9'
+
+
+class FakeServer:
+
+    def __init__(self, latency=0.0, error_rate=0.0, capacity=None,
+                 retry_after=None):
+        """
+        Локальный HTTP сервер для замеров и проверок без сети.
+        :param latency: Задержка перед каждым ответом в секундах.
+        :param error_rate: Доля запросов, на которые сервер отвечает 503.
+        :param capacity: Количество одновременных запросов, которое сервер
+                         обрабатывает без роста задержки. Сверх него
+                         задержка растет пропорционально нагрузке, а
+                         сверх удвоенного - сервер отвечает 503.
+        :param retry_after: Значение заголовка Retry-After в ответах 503
+                            при перегрузке.
+        :return: None.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def dispatch(self, method, path, params, headers, body=b''):
+        """
+        Обработка запроса.
+        :param method: HTTP метод.
+        :param path: Путь запроса.
+        :param params: Словарь параметров запроса и формы.
+        :param headers: Заголовки запроса.
+        :param body: Тело запроса, если это не форма.
+        :return: Тройка (статус, заголовки, тело ответа).
+        """
+        raise NotImplementedError
+
+    def get_cut(self, method, path):
+        """
+        Количество байт тела, после которых соединение обрывается.
+        :param method: HTTP метод.
+        :param path: Путь запроса.
+        :return: Количество байт или None, если тело отправляется целиком.
+        """
+        return None
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # заголовки и тело отправляются отдельно, без Nagle ответ
+            # не ждет подтверждения от клиента
+            disable_nagle_algorithm = True
+
+            def read_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0], 16)
+                        chunk = self.rfile.read(size)
+                        self.rfile.readline()
+                        if not size:
+                            return b''.join(chunks)
+                        chunks.append(chunk)
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def handle_request(self, method):
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query))
+                body = self.read_body()
+                if self.headers.get('Content-Type') == \
+                        'application/x-www-form-urlencoded':
+                    params.update(parse_qsl(body.decode()))
+                    body = b''
+                with fake.lock:
+                    fake.requests[parts.path] += 1
+                    fake.in_flight += 1
+                    load = fake.in_flight
+                try:
+                    status, headers, body = self.respond(
+                        method, parts.path, params, body, load)
+                finally:
+                    with fake.lock:
+                        fake.in_flight -= 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if method == 'HEAD':
+                    return
+                cut = fake.get_cut(method, parts.path)
+                if cut is None:
+                    self.wfile.write(body)
+                    return
+                # обрыв соединения на середине тела ответа
+                self.wfile.write(body[:cut])
+                self.wfile.flush()
+                self.close_connection = True
+
+            def respond(self, method, path, params, body, load):
+                if fake.capacity and load > 2 * fake.capacity:
+                    headers = {}
+                    if fake.retry_after is not None:
+                        headers['Retry-After'] = str(fake.retry_after)
+                    return 503, headers, b''
+                if fake.capacity:
+                    time.sleep(fake.latency * max(1, load / fake.capacity))
+                else:
+                    time.sleep(fake.latency)
+                if random.random() < fake.error_rate:
+                    return 503, {}, b''
+                return fake.dispatch(method, path, params, self.headers, body)
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_HEAD(self):
+                self.handle_request('HEAD')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+            def do_PUT(self):
+                self.handle_request('PUT')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def json_response(data, status=200):
+    return status, {'Content-Type': 'application/json'}, \
+        json.dumps(data).encode()
+
+
+class FakeCDN(FakeServer):
+
+    def __init__(self, photo_size=100 * 1024, ranges=True, cut_after=None,
+                 cuts=0, distinct=False, **kwargs):
+        """
+        Имитация сервера фотографий VK с поддержкой HTTP Range.
+        :param photo_size: Размер каждой фотографии в байтах.
+        :param distinct: Разное содержимое фотографий с разными путями,
+                         по умолчанию все фотографии одинаковые.
+        :param ranges: Поддержка докачки, без нее сервер всегда
+                       отвечает 200 с фотографией целиком.
+        :param cut_after: Количество байт, после которых обрывается
+                          соединение при скачивании.
+        :param cuts: Количество скачиваний, которые будут оборваны.
+        :return: None.
+        """
+        super().__init__(**kwargs)
+        self.body = make_jpeg(photo_size)
+        self.ranges = ranges
+        self.cut_after = cut_after
+        self.cuts = cuts
+        self.distinct = distinct
+        # заголовки Range запросов GET в порядке поступления
+        self.range_headers = []
+
+    def get_cut(self, method, path):
+        with self.lock:
+            if method != 'GET' or self.cut_after is None or self.cuts <= 0:
+                return None
+            self.cuts -= 1
+            return self.cut_after
+
+    def get_body(self, path):
+        if not self.distinct:
+            return self.body
+        # путь записывается в начало заполнителя, размер не меняется
+        tag = path.encode()[:len(self.body) - len(JPEG_HEADER) - 2]
+        start = len(JPEG_HEADER)
+        return self.body[:start] + tag + self.body[start + len(tag):]
+
+    def dispatch(self, method, path, params, headers, body=b''):
+        if method == 'GET':
+            with self.lock:
+                self.range_headers.append(headers.get('Range'))
+        photo = self.get_body(path)
+        match = re.match(r'bytes=(\d+)-', headers.get('Range', ''))
+        if match is None or not self.ranges:
+            return 200, {'Content-Type': 'image/jpeg'}, photo
+        start = int(match.group(1))
+        total = len(photo)
+        if start >= total:
+            return 416, {'Content-Range': f"bytes */{total}"}, b''
+        return 206, {'Content-Type': 'image/jpeg',
+                     'Content-Range': f"bytes {start}-{total - 1}/{total}"}, \
+            photo[start:]
+
+
+class FakeVK(FakeServer):
+
+    def __init__(self, cdn_url, albums=None, **kwargs):
+        """
+        Имитация методов VK API users.get, photos.getAlbums, photos.get
+        и execute.
+        :param cdn_url: Адрес сервера фотографий.
+        :param albums: Словарь {ID альбома: количество фотографий},
+                       системные альбомы задаются именем ('profile')
+                       или отрицательным ID, если у альбома нет имени
+                       ('-9000'): их фотографии photos.get не отдает.
+        :return: None.
+        """
+        super().__init__(**kwargs)
+        self.cdn_url = cdn_url
+        self.albums = albums if albums is not None else {'profile': 100}
+        # время изменения обычных альбомов, у системных его нет
+        self.updated = {album_id: 1 for album_id in self.albums
+                        if not is_system_album(album_id)}
+
+    def add_photos(self, album_id, count):
+        """
+        Добавление фотографий в альбом с изменением времени изменения.
+        :param album_id: ID альбома.
+        :param count: Количество новых фотографий.
+        :return: None.
+        """
+        self.albums[album_id] = self.albums.get(album_id, 0) + count
+        if not is_system_album(album_id):
+            self.updated[album_id] = self.updated.get(album_id, 0) + 1
+
+    def get_page(self, owner_id, album_id, offset, count):
+        size = self.albums.get(str(album_id), 0)
+        items = [{'id': photo_id,
+                  'likes': {'count': photo_id % 50},
+                  'sizes': [{'type': 's', 'height': 75, 'width': 100,
+                             'url': f"{self.cdn_url}/{owner_id}_{album_id}"
+                                    f"_{photo_id}_s.jpg"},
+                            {'type': 'z', 'height': 1080, 'width': 1440,
+                             'url': f"{self.cdn_url}/{owner_id}_{album_id}"
+                                    f"_{photo_id}_z.jpg"}],
+                  }
+                 for photo_id in range(int(offset),
+                                       min(size, int(offset) + int(count)))]
+        return {'count': size, 'items': items}
+
+    def dispatch(self, method, path, params, headers, body=b''):
+        name = path.rsplit('/', 1)[-1]
+        if name == 'users.get':
+            return json_response({'response': [{'id': params['user_ids']}]})
+        if name == 'photos.getAlbums':
+            # VK возвращает числовые ID, в том числе у системных альбомов
+            items = [{'id': SYSTEM_ALBUMS.get(album_id) or int(album_id),
+                      'size': size, 'title': album_id,
+                      **({'updated': self.updated[album_id]}
+                         if album_id in self.updated else {})}
+                     for album_id, size in self.albums.items()]
+            return json_response({'response': {'count': len(items),
+                                                'items': items}})
+        if name == 'photos.get':
+            if params['album_id'].startswith('-'):
+                # системные альбомы photos.get принимает только по имени
+                return json_response({'error': {'error_code': 100}})
+            return json_response({'response': self.get_page(
+                params['owner_id'], params['album_id'],
+                params.get('offset', 0), params['count'])})
+        if name == 'execute':
+            calls = re.findall(r'API\.photos\.get\((\{.*?\})\)',
+                               params['code'])
+            pages = []
+            for call in map(json.loads, calls):
+                pages.append(self.get_page(call['owner_id'],
+                                           call['album_id'],
+                                           call['offset'], call['count']))
+            return json_response({'response': pages})
+        return json_response({'error': {'error_code': 3}})
+
+
+class FakeYandexDisk(FakeServer):
+
+    def __init__(self, fetch_delay=0.0, fetch_error_rate=0.0,
+                 fetch_size=None, **kwargs):
+        """
+        Имитация ресурсов /v1/disk/resources* и операций Яндекс.Диска.
+        :param fetch_delay: Время выполнения загрузки по URL в секундах.
+        :param fetch_error_rate: Доля загрузок по URL, которые завершаются
+                                 ошибкой (например, истекла ссылка VK).
+        :param fetch_size: Размер файлов, загруженных по URL, в листинге
+                           папки (сама фотография не скачивается).
+        :return: None.
+        """
+        super().__init__(**kwargs)
+        self.fetch_delay = fetch_delay
+        self.fetch_error_rate = fetch_error_rate
+        self.fetch_size = fetch_size
+        self.folders = set()
+        self.files = {}
+        self.operations = {}
+        # ссылки для загрузки файлов методом PUT
+        self.uploads = {}
+
+    def add_file(self, path, size=None):
+        folder = path.rsplit('/', 1)[0]
+        self.folders.add(folder)
+        self.files[path] = size
+
+    def settle(self):
+        # завершение операций, время выполнения которых прошло
+        now = time.monotonic()
+        for operation in self.operations.values():
+            if operation['status'] == 'in-progress' \
+                    and operation['ready'] <= now:
+                if operation['fails']:
+                    operation['status'] = 'failed'
+                else:
+                    operation['status'] = 'success'
+                    self.add_file(operation['path'], self.fetch_size)
+
+    def new_operation(self, path, delay):
+        operation_id = str(len(self.operations) + 1)
+        self.operations[operation_id] = {
+            'path': path, 'status': 'in-progress',
+            'ready': time.monotonic() + delay,
+            'fails': random.random() < self.fetch_error_rate}
+        return json_response(
+            {'href': f"{self.url}/v1/disk/operations/{operation_id}"}, 202)
+
+    def dispatch(self, method, path, params, headers, body=b''):
+        with self.lock:
+            self.settle()
+            disk_path = normalize_path(params.get('path', ''))
+            if path == '/v1/disk':
+                return json_response({'total_space': 10 ** 12})
+            if path.startswith('/v1/disk/operations/'):
+                operation = self.operations.get(path.rsplit('/', 1)[-1])
+                if operation is None:
+                    return json_response({}, 404)
+                return json_response({'status': operation['status']})
+            if path == '/v1/disk/resources' and method == 'PUT':
+                if disk_path in self.folders:
+                    return json_response({}, 409)
+                self.folders.add(disk_path)
+                return json_response({}, 201)
+            if path == '/v1/disk/resources' and method == 'GET':
+                return self.list_folder(disk_path, params)
+            if path == '/v1/disk/resources/upload' and method == 'POST':
+                if disk_path in self.files:
+                    return json_response({}, 409)
+                return self.new_operation(disk_path, self.fetch_delay)
+            if path == '/v1/disk/resources/upload' and method == 'GET':
+                if disk_path in self.files \
+                        and params.get('overwrite') != 'true':
+                    return json_response({}, 409)
+                upload_id = str(len(self.uploads) + 1)
+                self.uploads[upload_id] = disk_path
+                return json_response({
+                    'href': f"{self.url}/upload/{upload_id}",
+                    'method': 'PUT', 'templated': False})
+            if path.startswith('/upload/') and method == 'PUT':
+                disk_path = self.uploads.get(path.rsplit('/', 1)[-1])
+                if disk_path is None:
+                    return json_response({}, 404)
+                self.add_file(disk_path, len(body))
+                return 201, {}, b''
+            if path == '/v1/disk/resources/copy' and method == 'POST':
+                source = normalize_path(params['from'])
+                if source not in self.files:
+                    return json_response({}, 404)
+                self.add_file(disk_path, self.files[source])
+                return json_response({}, 201)
+        return json_response({}, 404)
+
+    def list_folder(self, disk_path, params):
+        if disk_path in self.files:
+            return json_response({'name': disk_path.rsplit('/', 1)[-1]})
+        if disk_path not in self.folders:
+            return json_response({}, 404)
+        names = sorted(path.rsplit('/', 1)[-1] for path in self.files
+                       if path.rsplit('/', 1)[0] == disk_path)
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 20))
+        return json_response({'_embedded': {
+            'items': [{'name': name,
+                       **({'size': self.files[f"{disk_path}/{name}"]}
+                          if self.files[f"{disk_path}/{name}"] is not None
+                          else {})}
+                      for name in names[offset:offset + limit]],
+            'total': len(names)}})
+
+
+def is_system_album(album_id):
+    """
+    Проверка, что альбом FakeVK системный.
+    :param album_id: ID альбома.
+    :return: True, если у альбома нет времени изменения.
+    """
+    return album_id in SYSTEM_ALBUMS or album_id.startswith('-')
+
+
+def normalize_path(path):
+    """
+    Приведение пути Яндекс.Диска к виду 'папка/файл'.
+    :param path: Путь на Яндекс.Диске.
+    :return: Путь без префикса 'disk:' и крайних '/'.
+    """
+    if path.startswith('disk:'):
+        path = path[len('disk:'):]
+    return path.strip('/')
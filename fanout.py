@@ -0,0 +1,249 @@
+import os
+import time
+import hashlib
+
+import requests
+
+from downloader import Downloader, IncompleteDownload, DEFAULT_WORKERS, \
+    PART_SUFFIX, get_content_length
+from http_client import ApiError
+from metrics import get_metrics, log_photo
+from pipeline import run_pipeline
+from sync_state import TARGET_PC, TARGET_YANDEX
+
+TARGETS = (TARGET_PC, TARGET_YANDEX)
+# статусы мест сохранения, при которых фотография считается сохраненной
+PC_SAVED_STATUSES = {'downloaded', 'linked', 'exists'}
+YANDEX_SAVED_STATUSES = {'success', 'exists'}
+TARGET_NAMES = {TARGET_PC: "ПК", TARGET_YANDEX: "Яндекс.Диск"}
+
+
+class FanOut:
+
+    def __init__(self, yd, downloader):
+        """
+        Сохранение фотографии сразу на компьютер и на Яндекс.Диск
+        с одним скачиванием из VK: поток фотографии записывается в файл
+        и одновременно отправляется на Яндекс.Диск.
+        :param yd: Объект YandexDisk с индексом папки альбома.
+        :param downloader: Объект Downloader для сохранения на компьютер.
+        :return: None.
+        """
+        self.yd = yd
+        self.downloader = downloader
+        self.client = downloader.client
+
+    def tee_photo(self, url, file_path, href):
+        """
+        Скачивание фотографии во временный файл с одновременной отправкой
+        по ссылке загрузки Яндекс.Диска.
+        :param url: URL фотографии.
+        :param file_path: Путь для сохранения фотографии.
+        :param href: Ссылка для загрузки файла методом PUT.
+        :return: Тройка (размер и хэш SHA-256 или None, если файл скачан
+                 не полностью; True, если фотография загружена на
+                 Яндекс.Диск).
+        """
+        part_path = file_path + PART_SUFFIX
+        hasher = hashlib.sha256()
+        size = 0
+        uploaded = False
+        with self.client.get(url, stream=True) as source:
+            source.raise_for_status()
+            total = get_content_length(source)
+            with open(part_path, 'wb') as file:
+
+                def chunks():
+                    nonlocal size
+                    for chunk in source.iter_content(
+                            self.downloader.chunk_size):
+                        file.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        yield chunk
+
+                try:
+                    # потоковое тело нельзя отправить повторно
+                    response = self.client.put(
+                        href, data=self.yd.count_upload(chunks()),
+                        max_retries=0)
+                    uploaded = response.status_code in {201, 202}
+                except (ApiError, requests.RequestException):
+                    pass
+        get_metrics().add_bytes('download', size)
+        if not uploaded or (total is not None and size != total):
+            # временный файл остается для докачки
+            return None, False
+        os.replace(part_path, file_path)
+        return (size, hasher.hexdigest()), True
+
+    def save_pc(self, url, file_path, downloaded):
+        """
+        Завершение сохранения на компьютер: докачка файла, если отправка
+        на Яндекс.Диск прервалась, и учет копий в индексе содержимого.
+        :param url: URL фотографии.
+        :param file_path: Путь для сохранения фотографии.
+        :param downloaded: Пара (размер, хэш) или None, если файл
+                           скачан не полностью.
+        :return: Пара (статус 'downloaded', 'linked' или 'failed',
+                 пара (размер, хэш) или None).
+        """
+        try:
+            if downloaded is None:
+                downloaded = self.downloader.download_photo(url, file_path)
+            dedupe = self.downloader.dedupe
+            if dedupe is None:
+                return 'downloaded', downloaded
+            size, digest = downloaded
+            if self.downloader.link_copy(url, file_path, digest):
+                return 'linked', downloaded
+            dedupe.add(TARGET_PC, digest, file_path, size, url)
+            return 'downloaded', downloaded
+        except (ApiError, requests.RequestException, IncompleteDownload,
+                OSError):
+            return 'failed', None
+
+    def save_one(self, folder, user_id, album_id, photo, targets):
+        """
+        Сохранение фотографии в указанные места. Каждое место проверяет
+        наличие фотографии само, скачивание из VK выполняется один раз.
+        :param folder: Папка для сохранения на компьютер.
+        :param user_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param photo: Запись о фотографии.
+        :param targets: Места сохранения ('pc' и/или 'yandex').
+        :return: Словарь {место сохранения: статус}.
+        """
+        url = photo['url']
+        file_path = os.path.join(folder, photo['file_name'])
+        path_photo = f"{user_id}/{album_id}/{photo['file_name']}"
+        statuses = {}
+        need_yandex = False
+        if TARGET_YANDEX in targets:
+            if photo['file_name'] in self.yd.folder_index:
+                statuses[TARGET_YANDEX] = 'exists'
+            else:
+                need_yandex = True
+        need_pc = False
+        if TARGET_PC in targets:
+            if not need_yandex:
+                statuses[TARGET_PC] = self.downloader.download_one(
+                    folder, photo)
+            elif os.path.exists(file_path) \
+                    and self.downloader.is_complete(url, file_path):
+                statuses[TARGET_PC] = 'exists'
+            else:
+                need_pc = True
+        if not need_yandex:
+            return statuses
+        if not need_pc:
+            # фотография уже есть на компьютере - скачивание из VK не нужно
+            if os.path.isfile(file_path):
+                uploaded = self.yd.upload_file(path_photo, file_path)
+            else:
+                uploaded = self.yd.relay_photo(path_photo, url)
+            statuses[TARGET_YANDEX] = 'success' if uploaded else 'failed'
+        else:
+            downloaded, uploaded = None, False
+            try:
+                href = self.yd.get_upload_href(path_photo)
+                downloaded, uploaded = self.tee_photo(url, file_path, href)
+            except (ApiError, ValueError, KeyError, OSError,
+                    requests.RequestException):
+                pass
+            statuses[TARGET_PC], downloaded = self.save_pc(
+                url, file_path, downloaded)
+            if not uploaded and downloaded is not None:
+                # повторная отправка из сохраненного файла
+                uploaded = self.yd.upload_file(path_photo, file_path,
+                                               overwrite=True)
+            statuses[TARGET_YANDEX] = 'success' if uploaded else 'failed'
+            if uploaded and self.yd.dedupe is not None:
+                size, digest = downloaded
+                self.yd.dedupe.add(TARGET_YANDEX, digest, path_photo, size)
+        if statuses[TARGET_YANDEX] == 'success':
+            self.yd.folder_index[photo['file_name']] = None
+        return statuses
+
+
+def fanout_photos(user_id, album_id, photos_list, yd, done_ids=None,
+                  workers=DEFAULT_WORKERS, dedupe=None, client=None,
+                  manifest=None, state=None):
+    """
+    Сохранение фотографий из VK на компьютер и на Яндекс.Диск с одним
+    скачиванием каждой фотографии.
+    :param user_id: ID пользователя VK.
+    :param album_id: ID альбома VK.
+    :param photos_list: Список или генератор фотографий для сохранения.
+    :param yd: Объект YandexDisk.
+    :param done_ids: Словарь {место сохранения: множество ID фотографий},
+                     сохраненных ранее: в эти места фотография не
+                     сохраняется.
+    :param workers: Количество одновременных загрузок.
+    :param dedupe: Индекс содержимого DedupeIndex для сохранения
+                   на компьютер.
+    :param client: HTTP клиент, по умолчанию - общий клиент.
+    :param manifest: Журнал сохранения Manifest.
+    :param state: Объект SyncState: результат каждой фотографии
+                  записывается сразу.
+    :return: Словарь {место сохранения: {'processed': количество
+             обработанных фотографий, 'failed': количество не сохраненных
+             фотографий}}.
+    """
+    done_ids = done_ids or {}
+    folder = f"{user_id}/{album_id}/"
+    print("Начинается сохранение фотографий на ПК и Яндекс.Диск...")
+    if not os.path.isdir(folder):
+        print(f"Папка по пути '{folder}' создана.")
+        os.makedirs(folder)
+    yd.get_user_info()
+    yd.create_folder(user_id, album_id)
+    yd.refresh_folder_index(user_id, album_id)
+    fanout = FanOut(yd, Downloader(workers, dedupe=dedupe, client=client))
+
+    def save_photo(photo):
+        start = time.perf_counter()
+        targets = [target for target in TARGETS
+                   if str(photo['photo_id']) not in done_ids.get(target, ())]
+        statuses = fanout.save_one(folder, user_id, album_id, photo, targets)
+        return statuses, time.perf_counter() - start
+
+    counts = {target: {'processed': 0, 'failed': 0} for target in TARGETS}
+    with get_metrics().phase('fanout'):
+        for count_photo, (photo, (statuses, seconds)) in enumerate(
+                run_pipeline(photos_list, save_photo, workers), start=1):
+            for target, status in statuses.items():
+                saved = is_saved(target, status)
+                counts[target]['processed'] += 1
+                counts[target]['failed'] += not saved
+                if state is not None:
+                    state.record(user_id, album_id, target,
+                                 [(photo, 'success' if saved else 'failed')])
+                if manifest is not None:
+                    file_path = os.path.join(folder, photo['file_name'])
+                    manifest.write(target, photo, status,
+                                   os.path.getsize(file_path)
+                                   if status != 'failed'
+                                   and os.path.isfile(file_path) else None,
+                                   seconds)
+            log_photo(f"Фотография №{count_photo} - {photo['file_name']}: "
+                      + ", ".join(f"{TARGET_NAMES[target]} - {status}"
+                                  for target, status in statuses.items())
+                      + ".")
+    for target, target_counts in counts.items():
+        print(f"{TARGET_NAMES[target]}: сохранено "
+              f"{target_counts['processed'] - target_counts['failed']} "
+              f"фотографий из {target_counts['processed']}.")
+    return counts
+
+
+def is_saved(target, status):
+    """
+    Проверка, что фотография сохранена в месте сохранения.
+    :param target: Место сохранения ('pc' или 'yandex').
+    :param status: Статус фотографии из fanout_photos.
+    :return: True, если фотография сохранена.
+    """
+    if target == TARGET_PC:
+        return status in PC_SAVED_STATUSES
+    return status in YANDEX_SAVED_STATUSES
@@ -0,0 +1,358 @@
+import re
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+# размер пула соединений на один хост
+POOL_SIZE = 32
+# время ожидания соединения и ответа сервера по умолчанию (в секундах),
+# после него зависший запрос повторяется
+TIMEOUT = (10, 60)
+# повторные попытки при ошибках сервера и превышении лимита запросов
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# ограничения частоты запросов: хост -> (запросов в секунду, размер пачки)
+RATE_LIMITS = {
+    'api.vk.com': (3, 3),
+    'cloud-api.yandex.net': (20, 20),
+}
+
+
+class ApiError(Exception):
+    """Базовая ошибка при обращении к API."""
+
+
+class NetworkError(ApiError):
+    """Сервер недоступен или соединение оборвалось."""
+
+
+class HttpError(ApiError):
+    """Сервер ответил ошибкой."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        # пауза из заголовка Retry-After последнего ответа
+        self.retry_after = retry_after
+
+
+class RateLimitError(HttpError):
+    """Превышен лимит запросов к API."""
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        """
+        Инициализация ограничителя частоты запросов.
+        :param rate: Количество запросов в секунду.
+        :param capacity: Максимальное количество запросов подряд.
+        :return: None.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Ожидание разрешения на отправку запроса.
+        :return: None.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens
+                                  + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+
+    def __init__(self, name, initial=4, minimum=1, maximum=32,
+                 decrease=0.5, latency_spike=2.0):
+        """
+        Ограничитель количества одновременных запросов с подстройкой по
+        принципу AIMD: при быстрых успешных ответах предел растет на 1 за
+        каждые "предел" ответов, при ответах 429/503 или росте задержки -
+        уменьшается в decrease раз (не чаще одного раза за время ответа).
+        :param name: Название для вывода состояния.
+        :param initial: Начальный предел.
+        :param minimum: Минимальный предел.
+        :param maximum: Максимальный предел.
+        :param decrease: Множитель уменьшения предела.
+        :param latency_spike: Во сколько раз сглаженная задержка должна
+                              превысить минимальную, чтобы считаться ростом.
+        :return: None.
+        """
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_spike = latency_spike
+        self.in_flight = 0
+        # сглаженная и минимальная (медленно забываемая) задержки
+        self.latency = None
+        self.min_latency = None
+        self.decreased_at = 0.0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Ожидание свободного места и паузы после Retry-After.
+        :return: Время начала запроса.
+        """
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.monotonic()
+                self.condition.wait(wait if wait > 0 else None)
+
+    def release(self, start, throttled=False, retry_after=None,
+                failed=False):
+        """
+        Освобождение места и подстройка предела по результату запроса.
+        :param start: Время начала запроса из acquire.
+        :param throttled: True, если сервер ответил 429 или 503.
+        :param retry_after: Пауза из заголовка Retry-After.
+        :param failed: True, если запрос завершился другой ошибкой: такой
+                       ответ не учитывается в задержке и не увеличивает
+                       предел.
+        :return: None.
+        """
+        now = time.monotonic()
+        elapsed = now - start
+        with self.condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            old_limit = int(self.limit)
+            if throttled:
+                if retry_after:
+                    self.paused_until = max(self.paused_until,
+                                            now + retry_after)
+                self.cut(now, f"ответ сервера 429/503"
+                         + (f", пауза {retry_after:.1f} с"
+                            if retry_after else ""))
+            elif not failed:
+                self.observe(elapsed)
+                if self.latency > self.latency_spike * self.min_latency:
+                    self.cut(now, f"задержка {self.latency * 1000:.0f} мс")
+                elif saturated:
+                    self.limit = min(self.maximum,
+                                     self.limit + 1 / self.limit)
+                    if int(self.limit) > old_limit:
+                        self.log(f"задержка {self.latency * 1000:.0f} мс")
+            self.condition.notify_all()
+
+    def observe(self, elapsed):
+        """
+        Учет задержки успешного ответа.
+        :param elapsed: Время ответа в секундах.
+        :return: None.
+        """
+        if self.latency is None:
+            self.latency = self.min_latency = elapsed
+            return
+        self.latency += 0.2 * (elapsed - self.latency)
+        # минимальная задержка медленно растет, чтобы со временем
+        # подстроиться под новый уровень
+        self.min_latency = min(self.min_latency * 1.01, elapsed)
+
+    def cut(self, now, reason):
+        """
+        Уменьшение предела не чаще одного раза за время ответа.
+        :param now: Текущее время.
+        :param reason: Причина для вывода состояния.
+        :return: None.
+        """
+        if now - self.decreased_at < (self.latency or 0):
+            return
+        self.decreased_at = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        if self.latency is not None:
+            # после уменьшения задержка измеряется заново
+            self.latency = self.min_latency
+        self.log(reason)
+
+    def log(self, reason):
+        print(f"{self.name}: одновременных запросов {int(self.limit)} "
+              f"({reason}).")
+
+
+class HttpClient:
+
+    def __init__(self, rate_limits=None, max_retries=MAX_RETRIES,
+                 pool_size=POOL_SIZE):
+        """
+        Инициализация общего HTTP клиента с пулом соединений,
+        ограничением частоты запросов и повторными попытками.
+        :param rate_limits: Словарь {хост: (запросов в секунду, пачка)}.
+        :param max_retries: Количество повторных попыток.
+        :param pool_size: Размер пула соединений на один хост.
+        :return: None.
+        """
+        if rate_limits is None:
+            rate_limits = RATE_LIMITS
+        self.max_retries = max_retries
+        self.buckets = {host: TokenBucket(rate, capacity)
+                        for host, (rate, capacity) in rate_limits.items()}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, retry_if=None, max_retries=None,
+                **kwargs):
+        """
+        Отправка запроса с повторными попытками при ошибках 5xx и 429.
+        :param method: HTTP метод.
+        :param url: URL запроса.
+        :param retry_if: Дополнительная проверка ответа на необходимость
+                         повтора (например, ошибка лимита в теле ответа).
+        :param max_retries: Количество повторных попыток для этого запроса,
+                            по умолчанию - как у клиента. Для запросов с
+                            потоковым телом повтор невозможен.
+        :param kwargs: Параметры для requests.Session.request, по умолчанию
+                       с временем ожидания TIMEOUT.
+        :return: Объект ответа requests.Response.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        kwargs.setdefault('timeout', TIMEOUT)
+        bucket = self.buckets.get(urlsplit(url).hostname)
+        metrics = get_metrics()
+        endpoint = get_endpoint(url)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as error:
+                metrics.observe_request(method, endpoint, 'error',
+                                        time.perf_counter() - start)
+                if attempt >= max_retries:
+                    metrics.count_error(endpoint)
+                    raise NetworkError(f"Ошибка соединения: {error}")
+            else:
+                metrics.observe_request(method, endpoint,
+                                        response.status_code,
+                                        time.perf_counter() - start)
+                retry = (response.status_code in RETRY_STATUSES
+                         or (retry_if is not None and retry_if(response)))
+                if not retry:
+                    return response
+                response.close()
+                if attempt >= max_retries:
+                    metrics.count_error(endpoint)
+                    # 429 или ошибка лимита в теле успешного ответа
+                    if response.status_code < 500:
+                        raise RateLimitError(
+                            f"Превышен лимит запросов: {url}",
+                            response.status_code, get_retry_after(response))
+                    raise HttpError(
+                        f"Ошибка сервера {response.status_code}: {url}",
+                        response.status_code, get_retry_after(response))
+                retry_after = get_retry_after(response)
+                if retry_after is not None:
+                    metrics.count_retry(endpoint)
+                    time.sleep(retry_after)
+                    attempt += 1
+                    continue
+            metrics.count_retry(endpoint)
+            time.sleep(get_backoff(attempt))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def close(self):
+        """
+        Закрытие всех соединений.
+        :return: None.
+        """
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Получение общего HTTP клиента для всех модулей.
+    :return: Объект HttpClient.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get_endpoint(url):
+    """
+    Получение адреса запроса для метрик: для API - хост и путь без
+    числовых ID, для остальных серверов (фотографии) - только хост.
+    :param url: URL запроса.
+    :return: Адрес для метрик.
+    """
+    parts = urlsplit(url)
+    if parts.hostname not in RATE_LIMITS:
+        return parts.hostname
+    # версия API (v1) сохраняется, остальные части с цифрами заменяются
+    path = '/'.join(
+        '{id}' if re.search(r'\d', segment)
+        and not re.fullmatch(r'v\d+', segment) else segment
+        for segment in parts.path.split('/'))
+    return f"{parts.hostname}{path}"
+
+
+def get_backoff(attempt):
+    """
+    Пауза перед повторной попыткой с экспоненциальным ростом и
+    случайным разбросом.
+    :param attempt: Номер попытки, начиная с 0.
+    :return: Пауза в секундах.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def get_retry_after(response):
+    """
+    Получение паузы из заголовка Retry-After.
+    :param response: Объект ответа requests.Response.
+    :return: Пауза в секундах или None, если заголовка нет.
+    """
+    value = response.headers.get('Retry-After')
+    try:
+        return min(BACKOFF_MAX, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
@@ -1,65 +1,350 @@
 import os
-import json
+import time
+import argparse
+from collections import Counter
 
-import requests
 from dotenv import load_dotenv
-from vk import VK
-from yandex_disk import YandexDisk
+from budget import ByteBudget, parse_byte_size
+from dedupe import DedupeIndex
+from downloader import Downloader, DEFAULT_WORKERS
+from fanout import fanout_photos, TARGETS
+from http_client import ApiError
+from manifest import Manifest
+from metrics import get_metrics, log_photo
+from pipeline import run_pipeline
+from response_cache import ResponseCache, parse_ttl
+from sync_state import SyncState, DEFAULT_STATE_PATH, TARGET_PC, \
+    TARGET_YANDEX
+from vk import VK, VKError, SIZE_POLICY_MAX
+from yandex_disk import YandexDisk, UPLOAD_MODES, UPLOAD_MODE_AUTO
 
 load_dotenv()
 
+# количество одновременно обрабатываемых альбомов в режиме всех альбомов
+DEFAULT_ALBUM_WORKERS = 3
 
-def download_photos(user_id, album_id, photos_list):
+
+def download_photos(user_id, album_id, photos_list, workers=DEFAULT_WORKERS,
+                    dedupe=None, client=None, manifest=None, state=None):
     """
     Сохранений фотографий из VK на компьютер.
     :param user_id: ID пользователя VK.
     :param album_id: ID альбома VK.
-    :param photos_list: Список фотографий для сохранения.
-    :return: None.
+    :param photos_list: Список или генератор фотографий для сохранения,
+                        скачивание начинается с первой полученной фотографии.
+    :param workers: Количество одновременных загрузок.
+    :param dedupe: Индекс содержимого DedupeIndex для сохранения
+                   одинаковых фотографий жесткими ссылками.
+    :param client: HTTP клиент, по умолчанию - общий клиент.
+    :param manifest: Журнал сохранения Manifest.
+    :param state: Объект SyncState: результат каждой фотографии
+                  записывается сразу.
+    :return: Словарь {статус: количество фотографий}, где статус -
+             'downloaded', 'linked', 'exists' или 'failed'.
     """
-    # создает папку с именем == ID пользователя, если не создана
-    count_photo = 1  # счетчик всех фотографий
-    downloaded_photos = 0  # счетчик загруженных фотографий
+    folder = f"{user_id}/{album_id}/"
     print("Начинается загрузка фотографий...")
     # проверка на наличие папки
-    if not os.path.isdir(f'{user_id}/{album_id}/'):
-        print(f"Папка по пути '{user_id}/{album_id}/' создана.")
-        os.makedirs(f"{user_id}/{album_id}/")
-    for photo in photos_list:
-        response = requests.get(photo['url'])
-        file_path = f"{user_id}/{album_id}/{photo['file_name']}"
-        # проверка на дублирование фотографий
-        if not os.path.exists(file_path):
-            with open(file_path, 'wb') as file:
-                file.write(response.content)
-                downloaded_photos += 1
-                print(f"Фотография №{count_photo}"
-                      f" - {photo['file_name']} загружена.")
+    if not os.path.isdir(folder):
+        print(f"Папка по пути '{folder}' создана.")
+        os.makedirs(folder)
+    downloader = Downloader(workers, dedupe=dedupe, client=client)
+
+    def save_photo(photo):
+        start = time.perf_counter()
+        status = downloader.download_one(folder, photo)
+        return status, time.perf_counter() - start
+
+    counts = Counter()
+    with get_metrics().phase('download'):
+        for count_photo, (photo, (status, seconds)) in enumerate(
+                run_pipeline(photos_list, save_photo, workers), start=1):
+            if manifest is not None:
+                file_path = os.path.join(folder, photo['file_name'])
+                manifest.write(TARGET_PC, photo, status,
+                               os.path.getsize(file_path)
+                               if status != 'failed' else None, seconds)
+            if state is not None:
+                state.record(user_id, album_id, TARGET_PC,
+                             [(photo, 'failed' if status == 'failed'
+                               else 'success')])
+            if status == 'downloaded':
+                log_photo(f"Фотография №{count_photo}"
+                          f" - {photo['file_name']} загружена.")
+            elif status == 'linked':
+                log_photo(f"Фотография №{count_photo}"
+                          f" - {photo['file_name']} сохранена копией.")
+            elif status == 'exists':
+                log_photo(f"Фотография №{count_photo}"
+                          f" - {photo['file_name']} уже существует.")
+            else:
+                log_photo(f"Фотография №{count_photo}"
+                          f" - {photo['file_name']} не удалось загрузить.")
+            counts[status] += 1
+    print(f"Загружено {counts['downloaded']} фотографий "
+          f"из {sum(counts.values())}.")
+    return counts
+
+
+def backup_album(user_id, album_id, photos_list, target, state, yd=None,
+                 workers=DEFAULT_WORKERS, full_resync=False, dedupe=None,
+                 budget=None):
+    """
+    Сохранение новых фотографий альбома с учетом состояния синхронизации.
+    :param user_id: ID пользователя ВК.
+    :param album_id: ID альбома ВК.
+    :param photos_list: Список или генератор фотографий альбома.
+    :param target: Место сохранения ('pc' или 'yandex').
+    :param state: Объект SyncState.
+    :param yd: Объект YandexDisk для сохранения на Яндекс.Диск.
+    :param workers: Количество одновременных загрузок на ПК.
+    :param full_resync: Игнорировать сохраненное состояние альбома.
+    :param dedupe: Индекс содержимого DedupeIndex для сохранения на ПК.
+    :param budget: Бюджет передаваемых данных ByteBudget на весь запуск.
+    :return: Словарь с количеством сохраненных ('saved'), не сохраненных
+             ('failed') и пропущенных ('skipped') фотографий.
+    """
+    # отбор фотографий, не сохраненных при прошлых запусках
+    if full_resync:
+        state.clear(user_id, album_id, target)
+    done_ids = state.get_done_ids(user_id, album_id, target)
+    seen_count = 0  # количество всех фотографий альбома
+
+    def new_photos():
+        nonlocal seen_count
+        for photo in photos_list:
+            seen_count += 1
+            if str(photo['photo_id']) not in done_ids:
+                yield photo
+
+    photos = new_photos()
+    unknown_photos = []  # фотографии с неизвестным размером
+    if budget is not None:
+        # для ранжирования нужен весь список новых фотографий
+        photos, unknown_photos = budget.select(photos)
+
+    manifest = Manifest(user_id, album_id)
+    try:
+        # результат каждой фотографии записывается в состояние сразу,
+        # память не растет с количеством фотографий
+        if target == TARGET_PC:
+            # скачивание на пк фотографий с VK
+            counts = download_photos(user_id, album_id, photos, workers,
+                                     dedupe, manifest=manifest, state=state)
+            processed = sum(counts.values())
+            failed = counts['failed']
         else:
-            print(f"Фотография №{count_photo}"
-                  f" - {photo['file_name']} уже существует.")
-        count_photo += 1
-    print(f"Загружено {downloaded_photos} фотографий из {len(photos_list)}.")
+            uploaded, processed = yd.load_photos(user_id, album_id, photos,
+                                                 manifest, state)
+            failed = processed - uploaded
+        # JSON файл со списком сохраненных фотографий
+        manifest.compact()
+    finally:
+        manifest.close()
+    print(f"Новых фотографий: {processed} из {seen_count}.")
+    unknown = len(unknown_photos)
+    return {'saved': processed - failed,
+            'failed': failed + unknown,
+            'skipped': seen_count - processed - unknown}
 
 
-def writing_json(user_id, album_id, photos_list):
+def backup_album_fanout(user_id, album_id, photos_list, state, yd,
+                        workers=DEFAULT_WORKERS, full_resync=False,
+                        dedupe=None, budget=None):
     """
-    Запись результата в JSON файл.
+    Сохранение новых фотографий альбома сразу на ПК и на Яндекс.Диск
+    с одним скачиванием каждой фотографии из VK. Состояние
+    синхронизации учитывается для каждого места сохранения отдельно.
     :param user_id: ID пользователя ВК.
     :param album_id: ID альбома ВК.
-    :param photos_list: Список загруженных фотографий.
+    :param photos_list: Список или генератор фотографий альбома.
+    :param state: Объект SyncState.
+    :param yd: Объект YandexDisk.
+    :param workers: Количество одновременных загрузок.
+    :param full_resync: Игнорировать сохраненное состояние альбома.
+    :param dedupe: Индекс содержимого DedupeIndex.
+    :param budget: Бюджет передаваемых данных ByteBudget на весь запуск.
+    :return: Словарь {место сохранения: результат как у backup_album}.
+    """
+    if full_resync:
+        for target in TARGETS:
+            state.clear(user_id, album_id, target)
+    done_ids = {target: state.get_done_ids(user_id, album_id, target)
+                for target in TARGETS}
+    seen_count = 0  # количество всех фотографий альбома
+    new_count = 0  # количество новых фотографий, переданных на сохранение
+
+    def new_photos():
+        nonlocal seen_count
+        for photo in photos_list:
+            seen_count += 1
+            photo_id = str(photo['photo_id'])
+            if any(photo_id not in done for done in done_ids.values()):
+                yield photo
+
+    def counted(photos):
+        nonlocal new_count
+        for photo in photos:
+            new_count += 1
+            yield photo
+
+    photos = new_photos()
+    unknown_photos = []  # фотографии с неизвестным размером
+    if budget is not None:
+        photos, unknown_photos = budget.select(photos)
+
+    manifest = Manifest(user_id, album_id)
+    try:
+        counts = fanout_photos(user_id, album_id, counted(photos), yd,
+                               done_ids, workers, dedupe, manifest=manifest,
+                               state=state)
+        manifest.compact()
+    finally:
+        manifest.close()
+    album_result = {}
+    for target, target_counts in counts.items():
+        processed = target_counts['processed']
+        failed = target_counts['failed']
+        unknown = sum(1 for photo in unknown_photos
+                      if str(photo['photo_id']) not in done_ids[target])
+        album_result[target] = {'saved': processed - failed,
+                                'failed': failed + unknown,
+                                'skipped': seen_count - processed - unknown}
+    print(f"Новых фотографий: {new_count} из {seen_count}.")
+    return album_result
+
+
+def parse_args(args=None):
+    """
+    Разбор аргументов командной строки.
+    :param args: Список аргументов, по умолчанию - sys.argv.
+    :return: Объект с аргументами.
+    """
+    parser = argparse.ArgumentParser(
+        description="Backup фотографий из VK на Яндекс.Диск или ПК.")
+    parser.add_argument('--full-resync', action='store_true',
+                        help="игнорировать сохраненное состояние и "
+                             "заново проверить все фотографии альбома")
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH,
+                        help="путь к файлу состояния синхронизации")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="сохранять одинаковые фотографии из разных "
+                             "альбомов копиями без повторной передачи")
+    parser.add_argument('--all-albums', action='store_true',
+                        help="сохранить все альбомы пользователя, пропуская "
+                             "альбомы, не изменившиеся с прошлого запуска")
+    parser.add_argument('--album-workers', type=int,
+                        default=DEFAULT_ALBUM_WORKERS,
+                        help="количество одновременно обрабатываемых "
+                             "альбомов в режиме всех альбомов")
+    add_size_args(parser)
+    add_upload_mode_arg(parser)
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    return parser.parse_args(args)
+
+
+def add_cache_args(parser):
+    """
+    Добавление аргументов кэша ответов VK API.
+    :param parser: Объект ArgumentParser.
     :return: None.
     """
-    path_dir = f"json_files/{user_id}/"
-    path_file = f"json_files/{user_id}/{album_id}.json"
-    if not os.path.isdir(path_dir):
-        os.makedirs(path_dir)
-    with open(path_file, 'w', encoding='utf-8') as file:
-        json.dump(photos_list, file, indent=4, ensure_ascii=False)
-    print(f"Информация о загруженных фотографиях добавлена в json файл")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="не использовать кэш ответов VK API")
+    parser.add_argument('--cache-ttl', type=parse_ttl, action='append',
+                        default=[], metavar='METHOD=SECONDS',
+                        help="время жизни ответов метода VK API в кэше, "
+                             "например photos.getAlbums=3600 "
+                             "(0 - не кэшировать)")
+
 
+def open_cache(args):
+    """
+    Открытие кэша ответов VK API в файле состояния.
+    :param args: Объект с аргументами командной строки.
+    :return: Объект ResponseCache или None, если кэш отключен.
+    """
+    if args.no_cache:
+        return None
+    return ResponseCache(args.state, dict(args.cache_ttl))
 
-def main():
+
+def add_size_args(parser):
+    """
+    Добавление аргументов политики размера и бюджета передачи.
+    :param parser: Объект ArgumentParser.
+    :return: None.
+    """
+    parser.add_argument('--size-policy', default=SIZE_POLICY_MAX,
+                        help="выбор размера фотографий: 'max' - самый "
+                             "большой, 'cap:N' - самый большой не больше N "
+                             "пикселей, 'type:X' - тип размера VK, "
+                             "'min:N' - самый маленький не меньше N пикселей")
+    parser.add_argument('--byte-budget', type=parse_byte_size,
+                        help="бюджет передачи на запуск (например, 500M): "
+                             "сохраняются фотографии с наибольшим "
+                             "количеством лайков, пока бюджет не исчерпан")
+
+
+def add_upload_mode_arg(parser):
+    """
+    Добавление аргумента режима загрузки на Яндекс.Диск.
+    :param parser: Объект ArgumentParser.
+    :return: None.
+    """
+    parser.add_argument('--upload-mode', choices=UPLOAD_MODES,
+                        default=UPLOAD_MODE_AUTO,
+                        help="загрузка на Яндекс.Диск: 'url' - Яндекс.Диск "
+                             "скачивает фотографии сам, 'relay' - передача "
+                             "через программу без сохранения на диск, "
+                             "'auto' - по URL с передачей через программу "
+                             "неудавшихся загрузок")
+
+
+def add_metrics_args(parser):
+    """
+    Добавление аргументов метрик и тихого режима.
+    :param parser: Объект ArgumentParser.
+    :return: None.
+    """
+    parser.add_argument('--quiet', action='store_true',
+                        help="не выводить сообщения по каждой фотографии")
+    parser.add_argument('--metrics-json',
+                        help="путь для записи JSON сводки метрик запуска")
+    parser.add_argument('--metrics-prom',
+                        help="путь для записи метрик в формате Prometheus "
+                             "(textfile collector)")
+
+
+def write_metrics(args):
+    """
+    Запись метрик запуска в файлы, указанные в аргументах.
+    :param args: Объект с аргументами командной строки.
+    :return: None.
+    """
+    metrics = get_metrics()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+
+
+def main(args=None):
+    args = parse_args(args)
+    get_metrics().quiet = args.quiet
+    try:
+        run(args)
+    finally:
+        write_metrics(args)
+
+
+def run(args):
+    """
+    Интерактивный backup одного альбома или всех альбомов пользователя.
+    :param args: Объект с аргументами командной строки.
+    :return: None.
+    """
     # получение токена API VK и ID пользователя
     vk_token = input(
         "Введите токен VK API (если токен внесен в файл .env, нажмите ENTER): ")
@@ -67,27 +352,114 @@ def main():
         vk_token = os.getenv('VK_TOKEN')
     user_id = input(
         "Введите ID пользователя VK в числовом формате (например, 1234515): ")
-    vk = VK(vk_token, user_id)
-    photos_list = vk.get_photos_list()
+    cache = open_cache(args)
+    vk = VK(vk_token, user_id, cache=cache)
+    vk.set_size_policy(args.size_policy)
+    if not args.all_albums:
+        photos_list = vk.get_photos_list()
+        album_id = vk.get_album_id()
 
     choice = input("""Куда загрузить фотографии?
 - Введите 'пк' или 'pc' для скачивания на компьютер.
+- Введите 'оба' или 'both' для сохранения на компьютер и на Яндекс.Диск
+  с одним скачиванием каждой фотографии.
 - Для загрузки на Яндекс.Диск нажмите ENTER.
-""")
+""").lower()
 
-    if choice.lower() == 'пк' or choice.lower() == 'pc':
-        # скачивание на пк фотографий с VK
-        download_photos(user_id, vk.get_album_id(), photos_list)
+    if choice in {'пк', 'pc'}:
+        targets = [TARGET_PC]
+    elif choice in {'оба', 'both'}:
+        targets = list(TARGETS)
     else:
+        targets = [TARGET_YANDEX]
+    state = SyncState(args.state)
+    dedupe = DedupeIndex(args.state) if args.dedupe else None
+    budget = ByteBudget(args.byte_budget) \
+        if args.byte_budget is not None else None
+    yd_token = None
+    if TARGET_YANDEX in targets:
         # получение токена API Яндекс.Диска
         yd_token = input("Введите токен API Яндекс.Диска "
                          "(если токен внесен в файл .env, нажмите ENTER): ")
         if not yd_token:
             yd_token = os.getenv('YD_TOKEN')
-        yd = YandexDisk(yd_token)
-        yd.load_photos(user_id, vk.get_album_id(), photos_list)
-        writing_json(user_id, vk.get_album_id(), photos_list)
+    if args.all_albums:
+        backup_account(args, vk_token, user_id, targets, state,
+                       yd_token, dedupe, budget, cache)
+    else:
+        workers = DEFAULT_WORKERS
+        if TARGET_PC in targets:
+            workers = input(
+                "Количество одновременных загрузок "
+                f"(по умолчанию - {DEFAULT_WORKERS}, нажмите ENTER): ")
+            workers = int(workers) if workers.isdigit() else DEFAULT_WORKERS
+        yd = YandexDisk(yd_token, dedupe=dedupe,
+                        upload_mode=args.upload_mode) \
+            if TARGET_YANDEX in targets else None
+        if len(targets) > 1:
+            results = backup_album_fanout(user_id, album_id, photos_list,
+                                          state, yd, workers,
+                                          args.full_resync, dedupe, budget)
+        elif TARGET_PC in targets:
+            results = {TARGET_PC: backup_album(
+                user_id, album_id, photos_list, TARGET_PC, state,
+                workers=workers, full_resync=args.full_resync,
+                dedupe=dedupe, budget=budget)}
+        else:
+            results = {TARGET_YANDEX: backup_album(
+                user_id, album_id, photos_list, TARGET_YANDEX, state, yd=yd,
+                full_resync=args.full_resync, budget=budget)}
+        if any(result['failed'] for result in results.values()):
+            vk.forget_photos()
+    if dedupe is not None:
+        dedupe.report()
+        dedupe.close()
+    if cache is not None:
+        cache.report()
+        cache.close()
+    state.close()
+
+
+def backup_account(args, vk_token, user_id, targets, state, yd_token=None,
+                   dedupe=None, budget=None, cache=None):
+    """
+    Сохранение всех альбомов пользователя с параллельной обработкой
+    альбомов и пропуском альбомов, не изменившихся с прошлого запуска.
+    :param args: Объект с аргументами командной строки.
+    :param vk_token: Токен VK API.
+    :param user_id: ID пользователя VK.
+    :param targets: Список мест сохранения ('pc' и/или 'yandex').
+    :param state: Объект SyncState.
+    :param yd_token: Токен API Яндекс.Диска.
+    :param dedupe: Индекс содержимого DedupeIndex.
+    :param budget: Бюджет передаваемых данных ByteBudget.
+    :param cache: Кэш ответов VK API ResponseCache.
+    :return: Результат задания, как у batch.run_job.
+    """
+    # batch импортирует этот модуль, поэтому импорт внутри функции
+    from batch import run_job, ALL_ALBUMS
+    result = run_job({'user_id': user_id, 'albums': ALL_ALBUMS,
+                      'targets': targets},
+                     state, vk_token, yd_token, args.full_resync, dedupe,
+                     args.upload_mode, args.size_policy, budget, cache,
+                     args.album_workers)
+    if 'error' in result:
+        raise VKError(result['error'])
+    for album_id, album_result in result['albums'].items():
+        for target, target_result in album_result.items():
+            if 'error' in target_result:
+                print(f"Альбом '{album_id}' ({target}): ошибка "
+                      f"{target_result['error']}")
+            elif not target_result.get('unchanged'):
+                print(f"Альбом '{album_id}' ({target}): сохранено "
+                      f"{target_result['saved']}, "
+                      f"ошибок {target_result['failed']}.")
+    return result
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except ApiError as error:
+        print(error)
+        exit(1)
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import threading
+
+MANIFEST_DIR = "json_files"
+# статусы, при которых фотография считается сохраненной
+SAVED_STATUSES = {'success', 'downloaded', 'linked', 'exists'}
+
+
+class Manifest:
+
+    def __init__(self, user_id, album_id, folder=MANIFEST_DIR):
+        """
+        Открытие журнала сохранения альбома в формате JSON Lines.
+        Журнал только дополняется: каждая строка записывается на диск
+        сразу после обработки фотографии.
+        :param user_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param folder: Папка для журналов и JSON файлов.
+        :return: None.
+        """
+        path_dir = f"{folder}/{user_id}/"
+        if not os.path.isdir(path_dir):
+            os.makedirs(path_dir, exist_ok=True)
+        self.path = f"{path_dir}{album_id}.jsonl"
+        self.json_path = f"{path_dir}{album_id}.json"
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, target, photo, status, size=None, seconds=None):
+        """
+        Запись результата обработки фотографии.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param photo: Запись о фотографии.
+        :param status: Статус сохранения фотографии.
+        :param size: Количество байт фотографии, если оно известно.
+        :param seconds: Время обработки фотографии в секундах.
+        :return: None.
+        """
+        line = json.dumps({'time': time.time(),
+                           'target': target,
+                           'photo_id': photo['photo_id'],
+                           'file_name': photo['file_name'],
+                           'size': photo['type'],
+                           'status': status,
+                           'bytes': size,
+                           'seconds': seconds,
+                           }, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def compact(self):
+        """
+        Сжатие журнала в JSON файл со списком сохраненных фотографий
+        (последний статус каждой фотографии в каждом месте сохранения).
+        :return: Количество сохраненных фотографий в JSON файле.
+        """
+        with self.lock:
+            self.file.flush()
+        saved = {}
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # строка, оборванная при аварийном завершении
+                    continue
+                key = (record['target'], record['file_name'])
+                if record['status'] in SAVED_STATUSES:
+                    saved[key] = record['size']
+                elif record['status'] != 'pending':
+                    saved.pop(key, None)
+        photos = {}
+        for (_, file_name), size_type in saved.items():
+            photos.setdefault(file_name, size_type)
+        temp_path = f"{self.json_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump([{'file_name': file_name, 'size': size_type}
+                       for file_name, size_type in photos.items()],
+                      file, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.json_path)
+        print(f"Информация о загруженных фотографиях добавлена в json файл")
+        return len(photos)
+
+    def close(self):
+        """
+        Закрытие журнала.
+        :return: None.
+        """
+        self.file.close()
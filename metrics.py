@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# границы корзин гистограммы задержек запросов (в секундах)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_PREFIX = 'vk_backup'
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Инициализация гистограммы задержек.
+        :param buckets: Верхние границы корзин.
+        :return: None.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Накопленные количества по корзинам, последняя - '+Inf'.
+        :return: Список пар (граница, количество).
+        """
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class Metrics:
+
+    def __init__(self):
+        """
+        Инициализация счетчиков запуска: время этапов, запросы по
+        адресам, задержки, повторы, ошибки и переданные байты.
+        :return: None.
+        """
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = defaultdict(lambda: {'seconds': 0.0, 'count': 0})
+        self.requests = defaultdict(int)
+        self.latencies = defaultdict(Histogram)
+        self.retries = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        # отключение вывода по каждой фотографии
+        self.quiet = False
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Замер времени этапа. Время повторных и параллельных замеров
+        одного этапа суммируется.
+        :param name: Название этапа.
+        :return: Контекстный менеджер.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name]['seconds'] += elapsed
+                self.phases[name]['count'] += 1
+
+    def observe_request(self, method, endpoint, status, seconds):
+        """
+        Учет выполненного HTTP запроса.
+        :param method: HTTP метод.
+        :param endpoint: Адрес без переменных частей.
+        :param status: Код ответа или 'error' при ошибке соединения.
+        :param seconds: Время выполнения запроса.
+        :return: None.
+        """
+        with self.lock:
+            self.requests[(method, endpoint, str(status))] += 1
+            self.latencies[endpoint].observe(seconds)
+
+    def count_retry(self, endpoint):
+        with self.lock:
+            self.retries[endpoint] += 1
+
+    def count_error(self, endpoint):
+        with self.lock:
+            self.errors[endpoint] += 1
+
+    def add_bytes(self, direction, size):
+        """
+        Учет переданных данных.
+        :param direction: Направление: 'download' или 'upload'.
+        :param size: Количество байт.
+        :return: None.
+        """
+        with self.lock:
+            self.bytes[direction] += size
+
+    def summary(self):
+        """
+        Сводка метрик запуска.
+        :return: Словарь, пригодный для записи в JSON.
+        """
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration_seconds': time.time() - self.started,
+                'phases': {name: dict(value)
+                           for name, value in self.phases.items()},
+                'requests': [{'method': method, 'endpoint': endpoint,
+                              'status': status, 'count': count}
+                             for (method, endpoint, status), count
+                             in sorted(self.requests.items())],
+                'latency': {endpoint: {
+                    'count': histogram.count,
+                    'sum_seconds': histogram.total,
+                    'buckets': {str(bound): count for bound, count
+                                in histogram.cumulative()}}
+                    for endpoint, histogram in self.latencies.items()},
+                'retries': dict(self.retries),
+                'errors': dict(self.errors),
+                'bytes': dict(self.bytes),
+            }
+
+    def write_json(self, path):
+        """
+        Запись сводки метрик в JSON файл.
+        :param path: Путь к файлу.
+        :return: None.
+        """
+        write_atomic(path, json.dumps(self.summary(), indent=4,
+                                      ensure_ascii=False))
+
+    def write_prometheus(self, path):
+        """
+        Запись метрик в текстовом формате Prometheus (для textfile
+        collector node_exporter).
+        :param path: Путь к файлу.
+        :return: None.
+        """
+        summary = self.summary()
+        lines = [f"# TYPE {METRIC_PREFIX}_phase_seconds counter"]
+        for name, phase in summary['phases'].items():
+            lines.append(f'{METRIC_PREFIX}_phase_seconds{{phase="{name}"}} '
+                         f'{phase["seconds"]}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_requests_total counter")
+        for item in summary['requests']:
+            lines.append(
+                f'{METRIC_PREFIX}_requests_total{{method="{item["method"]}",'
+                f'endpoint="{item["endpoint"]}",status="{item["status"]}"}} '
+                f'{item["count"]}')
+        lines.append(
+            f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram")
+        for endpoint, latency in summary['latency'].items():
+            name = f"{METRIC_PREFIX}_request_duration_seconds"
+            for bound, count in latency['buckets'].items():
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{endpoint="{endpoint}"}} '
+                         f'{latency["sum_seconds"]}')
+            lines.append(f'{name}_count{{endpoint="{endpoint}"}} '
+                         f'{latency["count"]}')
+        for kind in ('retries', 'errors'):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{kind}_total counter")
+            for endpoint, count in summary[kind].items():
+                lines.append(f'{METRIC_PREFIX}_{kind}_total'
+                             f'{{endpoint="{endpoint}"}} {count}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_bytes_total counter")
+        for direction, size in summary['bytes'].items():
+            lines.append(f'{METRIC_PREFIX}_bytes_total'
+                         f'{{direction="{direction}"}} {size}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_duration_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_duration_seconds "
+                     f"{summary['duration_seconds']}")
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def write_atomic(path, text):
+    """
+    Запись файла через временный файл, чтобы читатели не увидели
+    частично записанный файл.
+    :param path: Путь к файлу.
+    :param text: Содержимое файла.
+    :return: None.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """
+    Получение общих метрик запуска.
+    :return: Объект Metrics.
+    """
+    return _metrics
+
+
+def log_photo(message):
+    """
+    Вывод сообщения о фотографии, если не включен тихий режим.
+    :param message: Текст сообщения.
+    :return: None.
+    """
+    if not _metrics.quiet:
+        print(message)
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+DEFAULT_WORKERS = 8
+# размер очереди между получением списка фотографий и загрузкой
+DEFAULT_QUEUE_SIZE = 256
+_STOP = object()
+
+
+def run_pipeline(items, handler, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Конвейер производитель/потребитель: элементы из генератора попадают в
+    ограниченную очередь и сразу обрабатываются пулом потоков.
+    :param items: Итерируемый источник элементов (например, генератор
+                  фотографий по страницам VK API).
+    :param handler: Функция обработки одного элемента.
+    :param workers: Количество потоков-обработчиков.
+    :param queue_size: Максимальный размер очереди.
+    :return: Генератор пар (элемент, результат) в порядке завершения.
+    """
+    workers = max(1, int(workers))
+    tasks = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+    errors = []
+
+    def produce():
+        try:
+            for item in items:
+                tasks.put(item)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            for _ in range(workers):
+                tasks.put(_STOP)
+
+    def consume():
+        try:
+            while True:
+                item = tasks.get()
+                if item is _STOP:
+                    break
+                results.put((item, handler(item)))
+        except Exception as error:
+            errors.append(error)
+            # освобождение очереди, чтобы производитель не остался
+            # заблокированным
+            while tasks.get() is not _STOP:
+                pass
+        finally:
+            results.put(_STOP)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=consume, daemon=True)
+                for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    finished = 0
+    while finished < workers:
+        result = results.get()
+        if result is _STOP:
+            finished += 1
+        else:
+            yield result
+    if errors:
+        raise errors[0]
@@ -0,0 +1,185 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from sync_state import DEFAULT_STATE_PATH
+
+# время жизни ответов по методам VK API (в секундах),
+# ответы остальных методов (в том числе users.get - проверки токена)
+# не кэшируются
+DEFAULT_TTLS = {
+    'photos.getAlbums': 60 * 60,
+    'photos.get': 10 * 60,
+    'execute': 10 * 60,
+}
+# методы, ответы которых содержат ссылки на сервер фотографий VK: ссылки
+# действуют ограниченное время, поэтому такие ответы не хранятся дольше
+URL_METHODS = {'photos.get', 'execute'}
+CDN_URL_TTL = 30 * 60
+# ограничение размера кэша (в байтах), при превышении удаляются
+# давно не использованные ответы
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+# параметры, которые не входят в ключ кэша
+SECRET_PARAMS = {'access_token'}
+
+
+class ResponseCache:
+
+    def __init__(self, path=DEFAULT_STATE_PATH, ttls=None,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Инициализация кэша ответов VK API на диске.
+        :param path: Путь к файлу базы данных SQLite.
+        :param ttls: Словарь {метод: время жизни в секундах}, дополняет
+                     и переопределяет DEFAULT_TTLS.
+        :param max_bytes: Максимальный размер кэша в байтах.
+        :return: None.
+        """
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        for method in URL_METHODS & set(self.ttls):
+            self.ttls[method] = min(self.ttls[method], CDN_URL_TTL)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    scope TEXT,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )""")
+        # статистика кэша за запуск
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, method, params):
+        """
+        Получение сохраненного ответа, если он еще не устарел.
+        :param method: Название метода VK API.
+        :param params: Параметры запроса.
+        :return: Ответ VK API или None.
+        """
+        ttl = self.ttls.get(method)
+        if not ttl:
+            return None
+        key = get_cache_key(method, params)
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None or row[1] + ttl < now:
+                self.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, method, params, response, scope=None):
+        """
+        Сохранение ответа и удаление давно не использованных ответов
+        при превышении размера кэша.
+        :param method: Название метода VK API.
+        :param params: Параметры запроса.
+        :param response: Ответ VK API.
+        :param scope: Метка для удаления группы ответов (например, альбома).
+        :return: None.
+        """
+        if not self.ttls.get(method):
+            return
+        value = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES "
+                "(?, ?, ?, ?, ?, ?, ?)",
+                (get_cache_key(method, params), method, scope, value,
+                 len(value), now, now))
+            self.evict()
+
+    def evict(self):
+        """
+        Удаление устаревших ответов, а затем давно не использованных,
+        пока размер кэша больше допустимого. Вызывается под блокировкой.
+        :return: None.
+        """
+        now = time.time()
+        for method, ttl in self.ttls.items():
+            self.connection.execute(
+                "DELETE FROM responses WHERE method = ? AND created_at < ?",
+                (method, now - ttl))
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY used_at").fetchall()
+        removed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            removed.append((key,))
+            total -= size
+        self.connection.executemany(
+            "DELETE FROM responses WHERE key = ?", removed)
+
+    def invalidate(self, scope=None):
+        """
+        Удаление сохраненных ответов.
+        :param scope: Метка группы ответов, по умолчанию - все ответы.
+        :return: None.
+        """
+        with self.lock, self.connection:
+            if scope is None:
+                self.connection.execute("DELETE FROM responses")
+            else:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE scope = ?", (scope,))
+
+    def report(self):
+        """
+        Вывод статистики кэша.
+        :return: None.
+        """
+        print(f"Кэш VK API: {self.hits} ответов из кэша, "
+              f"{self.misses} запросов к VK API.")
+
+    def close(self):
+        """
+        Закрытие соединения с базой данных.
+        :return: None.
+        """
+        self.connection.close()
+
+
+def get_cache_key(method, params):
+    """
+    Получение ключа кэша по методу и параметрам запроса без токена.
+    :param method: Название метода VK API.
+    :param params: Параметры запроса.
+    :return: Ключ кэша.
+    """
+    data = {name: str(value) for name, value in params.items()
+            if name not in SECRET_PARAMS}
+    return hashlib.sha256(json.dumps(
+        [method, data], sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def parse_ttl(value):
+    """
+    Разбор времени жизни ответов метода из командной строки.
+    :param value: Строка вида 'photos.getAlbums=3600'.
+    :return: Пара (метод, время жизни в секундах).
+    """
+    method, _, seconds = value.partition('=')
+    if not method or not seconds.isdigit():
+        raise ValueError(f"Неверное время жизни: {value}")
+    return method, int(seconds)
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import time
+
+DEFAULT_STATE_PATH = "sync_state.db"
+TARGET_PC = "pc"
+TARGET_YANDEX = "yandex"
+
+
+class SyncState:
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        """
+        Инициализация локального хранилища состояния резервного копирования.
+        :param path: Путь к файлу базы данных SQLite.
+        :return: None.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS photos (
+                    owner_id TEXT NOT NULL,
+                    album_id TEXT NOT NULL,
+                    photo_id TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    size_type TEXT,
+                    file_name TEXT,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (owner_id, album_id, photo_id, target)
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS albums (
+                    owner_id TEXT NOT NULL,
+                    album_id TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    size INTEGER,
+                    updated INTEGER,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (owner_id, album_id, target)
+                )""")
+
+    def get_done_ids(self, owner_id, album_id, target):
+        """
+        Получение ID фотографий, успешно сохраненных ранее.
+        :param owner_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :return: Множество ID фотографий.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT photo_id FROM photos WHERE owner_id = ? "
+                "AND album_id = ? AND target = ? AND status = 'success'",
+                (str(owner_id), str(album_id), target)).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, owner_id, album_id, target, results):
+        """
+        Запись результатов сохранения фотографий.
+        :param owner_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param results: Список пар (фотография, статус), где статус -
+                        'success', 'failed' или 'pending'.
+        :return: None.
+        """
+        now = time.time()
+        rows = [(str(owner_id), str(album_id), str(photo['photo_id']),
+                 target, photo['type'], photo['file_name'], status, now)
+                for photo, status in results]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO photos VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def is_album_unchanged(self, owner_id, album_id, target, size, updated):
+        """
+        Проверка, что альбом не изменился с последнего успешного
+        сохранения. Альбомы без времени изменения считаются измененными.
+        :param owner_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param size: Количество фотографий в альбоме.
+        :param updated: Время последнего изменения альбома.
+        :return: True, если альбом можно не проверять.
+        """
+        if updated is None:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, updated FROM albums WHERE owner_id = ? "
+                "AND album_id = ? AND target = ?",
+                (str(owner_id), str(album_id), target)).fetchone()
+        return row is not None and row == (size, updated)
+
+    def record_album(self, owner_id, album_id, target, size, updated):
+        """
+        Запись состояния полностью сохраненного альбома.
+        :param owner_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :param size: Количество фотографий в альбоме.
+        :param updated: Время последнего изменения альбома.
+        :return: None.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?, ?, ?)",
+                (str(owner_id), str(album_id), target, size, updated,
+                 time.time()))
+
+    def clear(self, owner_id, album_id, target):
+        """
+        Удаление сохраненного состояния альбома для полной синхронизации.
+        :param owner_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param target: Место сохранения ('pc' или 'yandex').
+        :return: None.
+        """
+        with self.lock, self.connection:
+            for table in ('photos', 'albums'):
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE owner_id = ? "
+                    "AND album_id = ? AND target = ?",
+                    (str(owner_id), str(album_id), target))
+
+    def close(self):
+        """
+        Закрытие соединения с базой данных.
+        :return: None.
+        """
+        self.connection.close()
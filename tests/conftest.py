@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# модули программы лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import HttpClient  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """HTTP клиент без ограничения частоты запросов."""
+    client = HttpClient(rate_limits={})
+    yield client
+    client.close()
@@ -0,0 +1,66 @@
+import time
+
+from fake_servers import FakeYandexDisk
+from http_client import AdaptiveLimiter
+from metrics import get_metrics
+from yandex_disk import YandexDisk, UPLOAD_MODE_URL
+
+
+def run_saturated(limiter, count, **outcome):
+    """Выполнение запросов, занимающих все места ограничителя."""
+    for _ in range(count):
+        starts = [limiter.acquire() for _ in range(int(limiter.limit))]
+        time.sleep(0.01)
+        for start in starts:
+            limiter.release(start, **outcome)
+
+
+def test_successes_raise_limit():
+    limiter = AdaptiveLimiter('test', initial=4, maximum=32)
+    run_saturated(limiter, 5)
+    assert int(limiter.limit) > 4
+
+
+def test_failures_do_not_raise_limit():
+    limiter = AdaptiveLimiter('test', initial=4, maximum=32)
+    run_saturated(limiter, 5, failed=True)
+    assert limiter.limit == 4
+    assert limiter.latency is None
+    assert limiter.in_flight == 0
+
+
+def test_throttling_halves_limit_and_pauses():
+    limiter = AdaptiveLimiter('test', initial=8, maximum=32)
+    limiter.release(limiter.acquire(), throttled=True, retry_after=0.2)
+    assert limiter.limit == 4
+    start = time.monotonic()
+    limiter.release(limiter.acquire())
+    assert time.monotonic() - start >= 0.15
+
+
+def test_uploads_converge_near_capacity(client):
+    capacity, latency, count = 8, 0.03, 600
+    limiter = AdaptiveLimiter('test', initial=2, maximum=32)
+    photos_list = [{'url': f"http://cdn.invalid/{i}.jpg",
+                    'file_name': f"{i}.jpg", 'type': 'z'}
+                   for i in range(count)]
+    get_metrics().quiet = True
+    try:
+        with FakeYandexDisk(latency=latency, capacity=capacity) as disk:
+            yd = YandexDisk('token', client=client,
+                            api_url=f"{disk.url}/v1/disk",
+                            upload_mode=UPLOAD_MODE_URL, limiter=limiter)
+            start = time.monotonic()
+            _, operations = yd.upload_all_photos(1, 'profile', photos_list)
+            elapsed = time.monotonic() - start
+            requests = disk.requests['/v1/disk/resources/upload']
+            accepted = len(disk.operations)
+    finally:
+        get_metrics().quiet = False
+    assert accepted == count
+    assert all(operations.values())
+    # предел колеблется вокруг пропускной способности сервера, количество
+    # одновременных запросов - целая часть предела
+    assert capacity / 2 <= int(limiter.limit) <= 2 * capacity + 1
+    assert (requests - accepted) / requests < 0.05
+    assert count / elapsed >= 0.6 * capacity / latency
@@ -0,0 +1,40 @@
+import pytest
+
+import batch
+from batch import run_job, EXIT_OK, EXIT_ERROR
+from fake_servers import FakeCDN, FakeVK
+from metrics import get_metrics
+from sync_state import SyncState, TARGET_PC
+from vk import VK
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    # папки альбомов и журналы сохранения создаются в текущей папке
+    monkeypatch.chdir(tmp_path)
+    state = SyncState(str(tmp_path / 'state.db'))
+    get_metrics().quiet = True
+    yield state
+    get_metrics().quiet = False
+    state.close()
+
+
+def test_single_album_string_is_one_album(state, client, monkeypatch):
+    with FakeCDN(1024) as cdn, \
+            FakeVK(cdn.url, {'profile': 3, 'wall': 2}) as server:
+        monkeypatch.setattr(batch, 'VK', lambda token, user_id, cache=None:
+                            VK(token, user_id, client=client,
+                               api_url=f"{server.url}/method"))
+        result = run_job({'user_id': 1, 'albums': 'profile',
+                          'targets': [TARGET_PC]}, state, 'token', 'token')
+    assert result['exit_code'] == EXIT_OK
+    assert list(result['albums']) == ['profile']
+    assert result['albums']['profile'][TARGET_PC]['saved'] == 3
+
+
+def test_invalid_albums_are_rejected(state):
+    result = run_job({'user_id': 1, 'albums': {'profile': 1}}, state,
+                     'token', 'token')
+    assert result['exit_code'] == EXIT_ERROR
+    assert "Неверный список альбомов" in result['error']
+    assert not result['albums']
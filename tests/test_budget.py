@@ -0,0 +1,34 @@
+import pytest
+
+from budget import ByteBudget
+from fake_servers import FakeCDN
+from main import backup_album
+from metrics import get_metrics
+from sync_state import SyncState, TARGET_PC
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    # папки альбома и журнал сохранения создаются в текущей папке
+    monkeypatch.chdir(tmp_path)
+    state = SyncState(str(tmp_path / 'state.db'))
+    get_metrics().quiet = True
+    yield state
+    get_metrics().quiet = False
+    state.close()
+
+
+def test_photos_with_unknown_size_are_failed(state, client, monkeypatch):
+    with FakeCDN(4096) as cdn:
+        photos_list = [{'url': f"{cdn.url}/{i}.jpg", 'photo_id': i,
+                        'file_name': f"{i}.jpg", 'type': 'z', 'likes': i}
+                       for i in range(4)]
+        budget = ByteBudget(10 ** 6, client=client)
+        get_size = budget.get_size
+        # размер первой фотографии узнать не удается
+        monkeypatch.setattr(budget, 'get_size', lambda url: None
+                            if url == photos_list[0]['url'] else get_size(url))
+        result = backup_album(1, 'profile', photos_list, TARGET_PC, state,
+                              budget=budget)
+    assert result == {'saved': 3, 'failed': 1, 'skipped': 0}
+    assert state.get_done_ids(1, 'profile', TARGET_PC) == {'1', '2', '3'}
@@ -0,0 +1,17 @@
+from dedupe import get_url_key
+
+PHOTO_URL = "https://sun9-1.userapi.com/impg/abc/photo.jpg"
+
+
+def test_url_key_ignores_signature():
+    assert get_url_key(f"{PHOTO_URL}?size=1280x960&quality=96&sign=aa") == \
+        get_url_key(f"{PHOTO_URL}?quality=96&sign=bb&size=1280x960")
+
+
+def test_url_key_keeps_size():
+    assert get_url_key(f"{PHOTO_URL}?size=1280x960&sign=aa") != \
+        get_url_key(f"{PHOTO_URL}?size=604x453&sign=aa")
+
+
+def test_url_key_without_query():
+    assert get_url_key(PHOTO_URL) == "sun9-1.userapi.com/impg/abc/photo.jpg"
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+import requests
+
+from downloader import Downloader, PART_SUFFIX
+from fake_servers import FakeCDN
+
+PHOTO_SIZE = 200 * 1024
+CUT_AFTER = 70 * 1024
+
+
+@pytest.fixture
+def downloader(client):
+    return Downloader(1, client=client)
+
+
+def test_cut_download_resumes_with_range(tmp_path, downloader):
+    file_path = str(tmp_path / 'photo.jpg')
+    with FakeCDN(PHOTO_SIZE, cut_after=CUT_AFTER, cuts=1) as server:
+        url = f"{server.url}/photo.jpg"
+        with pytest.raises(requests.RequestException):
+            downloader.fetch_part(url, file_path + PART_SUFFIX)
+        # в файле остаются только полностью полученные блоки
+        offset = os.path.getsize(file_path + PART_SUFFIX)
+        assert 0 < offset <= CUT_AFTER
+        assert not os.path.exists(file_path)
+        size, _ = downloader.download_photo(url, file_path)
+    assert server.range_headers == [None, f"bytes={offset}-"]
+    assert size == PHOTO_SIZE
+    with open(file_path, 'rb') as file:
+        assert file.read() == server.body
+    assert not os.path.exists(file_path + PART_SUFFIX)
+
+
+def test_cut_download_restarts_without_range(tmp_path, downloader):
+    file_path = str(tmp_path / 'photo.jpg')
+    with FakeCDN(PHOTO_SIZE, ranges=False, cut_after=CUT_AFTER, cuts=1) \
+            as server:
+        status = downloader.download_one(str(tmp_path),
+                                         {'url': f"{server.url}/photo.jpg",
+                                          'file_name': 'photo.jpg'})
+    assert status == 'downloaded'
+    # повтор запрашивает докачку, но сервер отдает фотографию целиком
+    assert len(server.range_headers) == 2
+    assert server.range_headers[1].startswith('bytes=')
+    with open(file_path, 'rb') as file:
+        assert file.read() == server.body
+
+
+def test_truncated_file_is_completed(tmp_path, downloader):
+    file_path = str(tmp_path / 'photo.jpg')
+    with FakeCDN(PHOTO_SIZE) as server:
+        with open(file_path, 'wb') as file:
+            file.write(server.body[:CUT_AFTER])
+        status = downloader.download_one(str(tmp_path),
+                                         {'url': f"{server.url}/photo.jpg",
+                                          'file_name': 'photo.jpg'})
+    assert status == 'downloaded'
+    assert server.range_headers == [f"bytes={CUT_AFTER}-"]
+    with open(file_path, 'rb') as file:
+        assert file.read() == server.body
+
+
+def test_complete_file_is_not_downloaded(tmp_path, downloader):
+    with FakeCDN(PHOTO_SIZE) as server:
+        with open(tmp_path / 'photo.jpg', 'wb') as file:
+            file.write(server.body)
+        status = downloader.download_one(str(tmp_path),
+                                         {'url': f"{server.url}/photo.jpg",
+                                          'file_name': 'photo.jpg'})
+    assert status == 'exists'
+    assert server.range_headers == []
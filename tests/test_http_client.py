@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+import http_client
+from fake_servers import FakeServer, json_response
+from http_client import HttpClient, HttpError, NetworkError, RateLimitError
+from vk import VK, is_rate_limited
+
+
+class ScriptedServer(FakeServer):
+
+    def __init__(self, responses):
+        """
+        Сервер, отвечающий по списку ответов, последний ответ повторяется.
+        :param responses: Список троек (статус, заголовки, тело).
+        :return: None.
+        """
+        super().__init__()
+        self.responses = list(responses)
+        self.times = []
+
+    def dispatch(self, method, path, params, headers, body=b''):
+        with self.lock:
+            self.times.append(time.monotonic())
+            if len(self.responses) > 1:
+                return self.responses.pop(0)
+            return self.responses[0]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, 'BACKOFF_BASE', 0.01)
+
+
+def test_retry_after_is_respected(client):
+    with ScriptedServer([(429, {'Retry-After': '0.3'}, b''),
+                         json_response({'ok': True})]) as server:
+        response = client.get(f"{server.url}/resource")
+    assert response.status_code == 200
+    assert len(server.times) == 2
+    assert server.times[1] - server.times[0] >= 0.25
+
+
+def test_repeated_5xx_raises_http_error():
+    client = HttpClient(rate_limits={}, max_retries=2)
+    with ScriptedServer([(503, {'Retry-After': '0'}, b'')]) as server:
+        with pytest.raises(HttpError) as error:
+            client.get(f"{server.url}/resource")
+    client.close()
+    assert not isinstance(error.value, RateLimitError)
+    assert error.value.status_code == 503
+    assert error.value.retry_after == 0
+    assert len(server.times) == 3
+
+
+def test_repeated_429_raises_rate_limit_error():
+    client = HttpClient(rate_limits={}, max_retries=1)
+    with ScriptedServer([(429, {}, b'')]) as server:
+        with pytest.raises(RateLimitError) as error:
+            client.get(f"{server.url}/resource")
+    client.close()
+    assert error.value.status_code == 429
+    assert len(server.times) == 2
+
+
+def test_vk_rate_limit_error_is_retried(client):
+    too_many = json_response({'error': {'error_code': 6}})
+    with ScriptedServer([too_many, too_many,
+                         json_response({'response': [{'id': 1}]})]) \
+            as server:
+        vk = VK('token', 1, client=client, api_url=f"{server.url}/method")
+        result = vk.get_users_info()
+    assert result == {'response': [{'id': 1}]}
+    assert len(server.times) == 3
+
+
+def test_vk_rate_limit_error_gives_up():
+    client = HttpClient(rate_limits={}, max_retries=1)
+    with ScriptedServer([json_response({'error': {'error_code': 6}})]) \
+            as server:
+        with pytest.raises(RateLimitError):
+            client.get(f"{server.url}/method/users.get",
+                       retry_if=is_rate_limited)
+    client.close()
+    assert len(server.times) == 2
+
+
+def test_stalled_server_times_out(monkeypatch):
+    monkeypatch.setattr(http_client, 'TIMEOUT', (1, 0.2))
+    client = HttpClient(rate_limits={}, max_retries=1)
+    server = ScriptedServer([json_response({'ok': True})])
+    server.latency = 2
+    with server:
+        start = time.monotonic()
+        with pytest.raises(NetworkError):
+            client.get(f"{server.url}/resource")
+        elapsed = time.monotonic() - start
+    client.close()
+    assert elapsed < 1.5
@@ -0,0 +1,62 @@
+import pytest
+
+import response_cache
+from fake_servers import FakeVK
+from response_cache import ResponseCache
+from vk import VK
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для кэша."""
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'state.db'),
+                          ttls={'photos.getAlbums': 60})
+    yield cache
+    cache.close()
+
+
+def test_vk_token_check_is_not_cached(client, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'state.db'),
+                          ttls={'users.get': 60})
+    with FakeVK('http://cdn.invalid') as server:
+        vk = VK('token', 1, client=client, api_url=f"{server.url}/method",
+                cache=cache)
+        vk.get_users_info()
+        vk.get_users_info()
+    cache.close()
+    assert server.requests['/method/users.get'] == 2
+
+
+def test_response_expires_after_ttl(cache, clock):
+    params = {'owner_id': 1, 'access_token': 'token'}
+    cache.put('photos.getAlbums', params, {'response': 1})
+    clock[0] += 59
+    # токен не входит в ключ кэша
+    assert cache.get('photos.getAlbums', {**params, 'access_token': 'new'}) \
+        == {'response': 1}
+    clock[0] += 2
+    assert cache.get('photos.getAlbums', params) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_response_is_evicted(cache, clock):
+    value = {'response': 'x' * 100}
+    cache.max_bytes = 2 * len(str(value)) + 10
+    cache.put('photos.getAlbums', {'owner_id': 1}, value)
+    clock[0] += 1
+    cache.put('photos.getAlbums', {'owner_id': 2}, value)
+    clock[0] += 1
+    # первый ответ использован позже второго
+    assert cache.get('photos.getAlbums', {'owner_id': 1}) == value
+    clock[0] += 1
+    cache.put('photos.getAlbums', {'owner_id': 3}, value)
+    assert cache.get('photos.getAlbums', {'owner_id': 1}) == value
+    assert cache.get('photos.getAlbums', {'owner_id': 2}) is None
+    assert cache.get('photos.getAlbums', {'owner_id': 3}) == value
@@ -0,0 +1,17 @@
+from fake_servers import FakeVK
+from vk import VK
+
+
+def test_system_albums_are_mapped_or_skipped(client):
+    albums = {'profile': 3, 'wall': 1, 'saved': 2, '-9000': 4, '100': 2}
+    with FakeVK('http://cdn.invalid', albums) as server:
+        vk = VK('token', 1, client=client, api_url=f"{server.url}/method")
+        albums_list = vk.get_albums()
+        # альбом -9000 photos.get не отдает - он пропускается
+        assert [album['id'] for album in albums_list] == \
+            ['profile', 'wall', 'saved', 100]
+        for album in albums_list:
+            photos_list = list(VK('token', 1, client=client,
+                                  api_url=f"{server.url}/method")
+                               .iter_album_photos(album['id']))
+            assert len(photos_list) == album['size']
@@ -0,0 +1,36 @@
+import math
+
+import pytest
+
+from fake_servers import FakeVK
+from vk import VK, ALL_PHOTOS, MAX_PHOTOS_PER_REQUEST, MAX_EXECUTE_CALLS
+
+
+def list_photos(client, album_size, count_photo):
+    """
+    Получение фотографий альбома с имитации VK API.
+    :return: Пара (список фотографий, счетчик запросов по путям).
+    """
+    with FakeVK('http://cdn.invalid', {'100': album_size}) as server:
+        vk = VK('token', 1, client=client, api_url=f"{server.url}/method")
+        photos_list = list(vk.iter_album_photos('100', count_photo))
+    return photos_list, server.requests
+
+
+def test_large_album_uses_execute_batches(client):
+    album_size = 30500
+    photos_list, requests = list_photos(client, album_size, ALL_PHOTOS)
+    pages = math.ceil(album_size / MAX_PHOTOS_PER_REQUEST)
+    assert len(photos_list) == album_size
+    assert len({photo['photo_id'] for photo in photos_list}) == album_size
+    assert requests['/method/photos.get'] == 1
+    assert requests['/method/execute'] == \
+        math.ceil((pages - 1) / MAX_EXECUTE_CALLS)
+
+
+@pytest.mark.parametrize('count_photo', [5, 1000])
+def test_single_page_is_one_call(client, count_photo):
+    photos_list, requests = list_photos(client, 30500, count_photo)
+    assert len(photos_list) == count_photo
+    assert sum(requests.values()) == 1
+    assert requests['/method/photos.get'] == 1
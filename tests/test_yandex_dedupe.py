@@ -0,0 +1,72 @@
+import pytest
+
+from dedupe import DedupeIndex
+from fake_servers import FakeCDN, FakeYandexDisk
+from metrics import get_metrics
+from yandex_disk import YandexDisk, UPLOAD_MODE_RELAY, UPLOAD_MODE_URL
+
+
+@pytest.fixture
+def dedupe(tmp_path):
+    dedupe = DedupeIndex(str(tmp_path / 'state.db'))
+    get_metrics().quiet = True
+    yield dedupe
+    get_metrics().quiet = False
+    dedupe.close()
+
+
+def make_photos(cdn, album_id, count):
+    return [{'url': f"{cdn.url}/{album_id}_{i}.jpg", 'photo_id': i,
+             'file_name': f"{i}.jpg", 'type': 'z'} for i in range(count)]
+
+
+def test_each_photo_is_fetched_from_vk_once(dedupe, client):
+    with FakeCDN(4096, distinct=True) as cdn, FakeYandexDisk() as disk:
+        photos_list = make_photos(cdn, 'profile', 5)
+        yd = YandexDisk('token', client=client, dedupe=dedupe,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=UPLOAD_MODE_RELAY)
+        uploaded, _ = yd.load_photos(1, 'first', photos_list)
+        # новые фотографии передаются через программу один раз
+        assert uploaded == 5
+        assert len(cdn.range_headers) == 5
+        assert len(disk.uploads) == 5
+        assert dedupe.copies == 0
+
+        uploaded, _ = yd.load_photos(1, 'second', photos_list)
+        # те же фотографии в другом альбоме копируются без скачивания
+        assert uploaded == 5
+        assert len(cdn.range_headers) == 5
+        assert len(disk.uploads) == 5
+        assert dedupe.copies == 5
+        assert len(disk.files) == 10
+
+
+def test_same_content_with_different_urls_is_copied(dedupe, client):
+    with FakeCDN(4096) as cdn, FakeYandexDisk() as disk:
+        yd = YandexDisk('token', client=client, dedupe=dedupe,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=UPLOAD_MODE_RELAY)
+        for album_id in ('profile', 'wall', '100'):
+            uploaded, _ = yd.load_photos(1, album_id,
+                                         make_photos(cdn, album_id, 4))
+            assert uploaded == 4
+        # одинаковое содержимое отправляется на Яндекс.Диск один раз
+        assert len(cdn.range_headers) == 12
+        assert len(disk.uploads) == 1
+        assert dedupe.copies == 11
+        assert len(disk.files) == 12
+
+
+def test_url_mode_is_kept_with_dedupe(dedupe, client):
+    with FakeCDN(4096) as cdn, FakeYandexDisk() as disk:
+        yd = YandexDisk('token', client=client, dedupe=dedupe,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=UPLOAD_MODE_URL)
+        uploaded, _ = yd.load_photos(1, 'profile',
+                                     make_photos(cdn, 'profile', 5))
+        # фотографии не проходят через программу
+        assert uploaded == 5
+        assert not cdn.range_headers
+        assert not disk.uploads
+        assert len(disk.operations) == 5
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from fake_servers import FakeCDN, FakeYandexDisk
+from manifest import Manifest
+from metrics import get_metrics
+from yandex_disk import YandexDisk, UPLOAD_MODE_RELAY, UPLOAD_MODE_URL
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = Manifest(1, 'profile', folder=str(tmp_path))
+    get_metrics().quiet = True
+    yield manifest
+    get_metrics().quiet = False
+    manifest.close()
+
+
+def read_bytes(manifest):
+    with open(manifest.path, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file]
+    return [record['bytes'] for record in records
+            if record['status'] == 'success']
+
+
+@pytest.mark.parametrize('upload_mode', [UPLOAD_MODE_RELAY, UPLOAD_MODE_URL])
+def test_manifest_lines_have_bytes(manifest, client, upload_mode):
+    with FakeCDN(4096) as cdn, FakeYandexDisk(fetch_size=4096) as disk:
+        photos_list = [{'url': f"{cdn.url}/{i}.jpg", 'photo_id': i,
+                        'file_name': f"{i}.jpg", 'type': 'z'}
+                       for i in range(3)]
+        yd = YandexDisk('token', client=client,
+                        api_url=f"{disk.url}/v1/disk",
+                        upload_mode=upload_mode)
+        uploaded, _ = yd.load_photos(1, 'profile', photos_list, manifest)
+        assert uploaded == 3
+        # повторный запуск: фотографии уже есть на диске
+        yd.load_photos(1, 'profile', photos_list, manifest)
+    assert read_bytes(manifest) == [4096] * 6
@@ -1,17 +1,67 @@
-import requests
-import pandas as pd
+import json
 
+from http_client import ApiError, get_client
+from metrics import get_metrics
+
+API_URL = 'https://api.vk.com/method'
 DEFAULT_COUNT = 5
 DEFAULT_ALBUM_ID = "profile"
+ALL_PHOTOS = "all"
+# максимальное количество фотографий в одном запросе photos.get
+MAX_PHOTOS_PER_REQUEST = 1000
+# максимальное количество обращений к API внутри одного вызова execute
+MAX_EXECUTE_CALLS = 25
+# ID системных альбомов в ответе photos.getAlbums и их имена, которые
+# принимает photos.get; фотографии остальных системных альбомов (например,
+# -9000 - фотографии с пользователем) photos.get не отдает
+SYSTEM_ALBUM_IDS = {-6: 'profile', -7: 'wall', -15: 'saved'}
+# код ошибки VK API "Too many requests per second"
+RATE_LIMIT_ERRORS = {6}
+# политики выбора размера фотографии: самый большой размер, самый большой
+# не больше N пикселей, размер заданного типа VK, самый маленький
+# не меньше N пикселей
+SIZE_POLICY_MAX = "max"
+SIZE_POLICY_CAP = "cap"
+SIZE_POLICY_TYPE = "type"
+SIZE_POLICY_MIN = "min"
+
+
+class VKError(ApiError):
+    """Ошибка при обращении к VK API."""
+
+
+class Photo:
+    """Компактная запись о фотографии для сохранения."""
+    __slots__ = ('url', 'photo_id', 'type', 'file_name', 'likes')
+
+    def __init__(self, url, photo_id, size_type, file_name, likes=0):
+        self.url = url
+        self.photo_id = photo_id
+        self.type = size_type
+        self.file_name = file_name
+        self.likes = likes
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
 
 
 class VK:
-    def __init__(self, token, user_id, version='5.131'):
+    def __init__(self, token, user_id, version='5.131', client=None,
+                 api_url=API_URL, cache=None):
         """
         Инициализация объекта класса VK для использования API.
         :param token: Токен VK API.
         :param user_id: ID пользователя VK.
         :param version: Версия VK API.
+        :param client: HTTP клиент, по умолчанию - общий клиент.
+        :param api_url: Адрес VK API.
+        :param cache: Кэш ответов ResponseCache, по умолчанию ответы
+                      не кэшируются.
         :return: None.
         """
         self.token = token
@@ -19,7 +69,11 @@ class VK:
         self.user_id = user_id
         self.album_id = None
         self.count_photo = None
+        self.size_policy = (SIZE_POLICY_MAX, None)
         self.params = {'access_token': self.token, 'v': self.version}
+        self.client = client or get_client()
+        self.api_url = api_url
+        self.cache = cache
 
     def set_album_id(self, album_id):
         """
@@ -51,104 +105,218 @@ class VK:
         """
         return self.count_photo
 
-    def get_users_info(self):
+    def set_size_policy(self, size_policy):
         """
-        Метод для получения данных о пользователе VK.
-        :return: Json файл с информацией о пользователе.
+        Метод для установки политики выбора размера фотографий.
+        :param size_policy: Политика: 'max', 'cap:N', 'type:X' или 'min:N'.
+        :return: None.
         """
-        url = 'https://api.vk.com/method/users.get'
-        params = {'user_ids': self.user_id}
+        self.size_policy = check_size_policy(size_policy)
+
+    def get_size_policy(self):
+        """
+        Метод для получения политики выбора размера фотографий.
+        :return: Пара (вид политики, значение).
+        """
+        return self.size_policy
+
+    def call_method(self, method, params, error_message, http_method='GET',
+                    scope=None, use_cache=True):
+        """
+        Метод для вызова метода VK API.
+        :param method: Название метода VK API.
+        :param params: Параметры метода.
+        :param error_message: Текст ошибки, если метод вернул ошибку.
+        :param http_method: HTTP метод запроса.
+        :param scope: Метка ответа в кэше для его удаления вместе с
+                      другими ответами альбома.
+        :param use_cache: Брать ответ из кэша, если он там есть. Новый
+                          ответ сохраняется в кэш в любом случае.
+        :return: Json ответ VK API.
+        """
+        url = f'{self.api_url}/{method}'
+        data = {**self.params, **params}
+        if self.cache is not None and use_cache:
+            cached = self.cache.get(method, data)
+            if cached is not None:
+                return cached
         try:
-            response = requests.get(url, params={**self.params, **params})
-            if response.json().get('response') is None:
+            with get_metrics().phase('vk_listing'):
+                if http_method == 'POST':
+                    response = self.client.post(url, data=data,
+                                                retry_if=is_rate_limited)
+                else:
+                    response = self.client.get(url, params=data,
+                                               retry_if=is_rate_limited)
+            result = response.json()
+            if result.get('response') is None:
                 raise ValueError
-            return response.json()
         except ValueError:
-            print("Ошибка токена API VK.")
-            exit()
+            raise VKError(error_message)
+        if self.cache is not None:
+            self.cache.put(method, data, result, scope)
+        return result
 
-    def get_albums_info(self):
+    def get_cache_scope(self):
+        """
+        Метод для получения метки ответов текущего альбома в кэше.
+        :return: Метка вида 'ID пользователя/ID альбома'.
+        """
+        return f"{self.user_id}/{self.album_id}"
+
+    def forget_photos(self):
+        """
+        Удаление из кэша списка фотографий текущего альбома, чтобы при
+        следующем получении ссылки на фотографии были новыми (например,
+        после ошибок сохранения из-за устаревших ссылок).
+        :return: None.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(self.get_cache_scope())
+
+    def get_users_info(self):
+        """
+        Метод для получения данных о пользователе VK. Ответ служит
+        проверкой токена, поэтому всегда запрашивается у VK.
+        :return: Json файл с информацией о пользователе.
+        """
+        params = {'user_ids': self.user_id}
+        return self.call_method('users.get', params, "Ошибка токена API VK.",
+                                use_cache=False)
+
+    def get_albums_info(self, use_cache=True):
         """
         Метод для получения информации об альбомах пользователя VK.
+        :param use_cache: Брать ответ из кэша, если он там есть.
         :return: Json файл с информацией об альбоме.
         """
-        url = 'https://api.vk.com/method/photos.getAlbums'
+        error_message = "Ошибка получения информации о пользователе."
+        if self.user_id == '':
+            raise VKError(error_message)
         params = {'owner_id': self.user_id,
                   'need_system': 1}
-        try:
-            response = requests.get(url, params={**self.params, **params})
-            if response.json().get('response') is None or self.user_id == '':
-                raise ValueError
-            return response.json()
-        except ValueError:
-            print("Ошибка получения информации о пользователе.")
-            exit()
+        return self.call_method('photos.getAlbums', params, error_message,
+                                use_cache=use_cache)
 
     def get_photos_info(self):
         """
         Метод для получения информации о фотографиях пользователя VK в альбоме.
+        Альбом обходится постранично (offset), страницы после первой
+        запрашиваются пачками до 25 штук через метод execute.
         :return: Json файл с информацией о фотографиях с профиля пользователя.
         """
-        url = 'https://api.vk.com/method/photos.get'
-        params = {'owner_id': self.user_id,
-                  'album_id': self.album_id,
-                  'count': self.count_photo,
-                  'extended': 1,
-                  'photo_sizes': 1,
-                  }
-        try:
-            response = requests.get(url, params={**self.params, **params})
-            if response.json().get('response') is None:
-                raise ValueError
-            return response.json()
-        except ValueError:
-            print("Ошибка получения информации об альбоме.")
-            exit()
+        pages = list(self.iter_photos_pages())
+        items = [item for page in pages for item in page['items']]
+        return {'response': {'count': pages[0]['count'], 'items': items}}
+
+    def iter_photos_pages(self):
+        """
+        Генератор страниц с фотографиями альбома.
+        Страницы отдаются по мере получения, не дожидаясь обхода всего
+        альбома.
+        :return: Генератор словарей с общим количеством фотографий
+                 и списком фотографий страницы.
+        """
+        first_page = self.get_photos_page(0, self.get_page_size(0))
+        total = first_page['count']
+        if self.count_photo != ALL_PHOTOS:
+            total = min(total, self.count_photo)
+        first_page['items'] = first_page['items'][:total]
+        yield first_page
+        offsets = list(range(MAX_PHOTOS_PER_REQUEST, total,
+                             MAX_PHOTOS_PER_REQUEST))
+        # разбиение оставшихся страниц на пачки для execute
+        for i in range(0, len(offsets), MAX_EXECUTE_CALLS):
+            batch = offsets[i:i + MAX_EXECUTE_CALLS]
+            yield from self.execute_photos_pages(batch, total)
+
+    def get_page_size(self, offset, total=None):
+        """
+        Метод для получения количества фотографий на странице.
+        :param offset: Смещение страницы от начала альбома.
+        :param total: Общее количество фотографий для загрузки.
+        :return: Количество фотографий на странице (не более 1000).
+        """
+        if total is None:
+            total = self.count_photo
+        if total == ALL_PHOTOS:
+            return MAX_PHOTOS_PER_REQUEST
+        return max(0, min(MAX_PHOTOS_PER_REQUEST, total - offset))
+
+    def get_photos_params(self, offset, count):
+        """
+        Метод для получения параметров запроса photos.get.
+        :param offset: Смещение страницы от начала альбома.
+        :param count: Количество фотографий на странице.
+        :return: Словарь параметров запроса.
+        """
+        return {'owner_id': self.user_id,
+                'album_id': self.album_id,
+                'offset': offset,
+                'count': count,
+                'extended': 1,
+                'photo_sizes': 1,
+                }
+
+    def get_photos_page(self, offset, count):
+        """
+        Метод для получения одной страницы фотографий альбома.
+        :param offset: Смещение страницы от начала альбома.
+        :param count: Количество фотографий на странице.
+        :return: Словарь с общим количеством фотографий и списком фотографий.
+        """
+        params = self.get_photos_params(offset, count)
+        return self.call_method(
+            'photos.get', params,
+            "Ошибка получения информации об альбоме.",
+            scope=self.get_cache_scope())['response']
+
+    def execute_photos_pages(self, offsets, total):
+        """
+        Метод для получения нескольких страниц фотографий одним вызовом
+        execute.
+        :param offsets: Список смещений страниц (не более 25).
+        :param total: Общее количество фотографий для загрузки.
+        :return: Список страниц с фотографиями.
+        """
+        calls = []
+        for offset in offsets:
+            params = self.get_photos_params(
+                offset, self.get_page_size(offset, total))
+            calls.append(f"API.photos.get({json.dumps(params)})")
+        params = {'code': f"return [{', '.join(calls)}];"}
+        error_message = "Ошибка получения информации об альбоме."
+        pages = self.call_method('execute', params, error_message,
+                                 http_method='POST',
+                                 scope=self.get_cache_scope())['response']
+        if not all(pages):
+            # ответ с ошибкой в части вызовов не должен остаться в кэше
+            self.forget_photos()
+            raise VKError(error_message)
+        return pages
 
     def get_max_photos(self, album_photos):
         """
-        Получение списка всех фотографий максимального размера.
+        Получение списка всех фотографий размера, выбранного политикой
+        (по умолчанию - максимального).
         :param album_photos: Информация по всем фотографиям в альбоме.
-        :return: Список json данных по каждой фотографии максимального размера.
+        :return: Список записей Photo по каждой фотографии.
         """
         print(f"Список всех фотографий из альбома '{self.album_id}' получен.")
-        photos_list = []
-        # проход по каждой фотографии в альбоме
-        for photos in album_photos['response']['items']:
-            max_height = 0
-            max_size_type = ''
-            url_max_photo = ''
-            # проход по каждому размеру отдельной фотографии
-            for photo in photos['sizes']:
-                # в файле встречаются размеры с 0 высотой, в таком случае
-                # берется последняя фотография в списке
-                if photo['height'] != 0:
-                    if photo['height'] > max_height:
-                        max_height = photo['height']
-                        url_max_photo = photo['url']
-                        max_size_type = photo['type']
-                else:
-                    url_max_photo = photo['url']
-                    max_size_type = photo['type']
-            # Информация каждой отдельной максимальной фотографии
-            data_photo = {
-                'url': url_max_photo,
-                'photo_id': photos['id'],
-                'type': max_size_type,
-                # 'file_name': f"{photos['likes']['count']}-{photos['id']}.jpg"
-                'file_name': check_name(photos['likes']['count'],
-                                        photos['id'],
-                                        photos_list)
-            }
-            photos_list.append(data_photo)
-        print(f"Список фотографий максимального размера сформирован "
-              f"({len(photos_list)} фото).")
+        photos_list = list(
+            iter_max_photos(album_photos['response']['items'],
+                            self.size_policy))
+        print(f"Список фотографий размера "
+              f"'{format_size_policy(self.size_policy)}' "
+              f"сформирован ({len(photos_list)} фото).")
         return photos_list
 
     def get_photos_list(self):
         """
-        Получение списка фотографий.
-        :return: Список json данных по каждой фотографии.
+        Получение фотографий альбома, выбранного пользователем.
+        Фотографии отдаются по мере получения страниц от VK API, поэтому
+        сохранение начинается до получения всего альбома.
+        :return: Генератор записей Photo.
         """
         # проверка на корректность ввода токена VK
         self.get_users_info()
@@ -159,13 +327,64 @@ class VK:
             "Введите ID альбома VK (по умолчанию - 'profile', нажмите ENTER): ")
         self.set_album_id(album_id)
         count_photo = input("Количество фотографий для загрузки "
-                            "(по умолчанию - 5, нажмите ENTER): ")
+                            "('all' - все фотографии, "
+                            "по умолчанию - 5, нажмите ENTER): ")
+        photos_list = self.iter_album_photos(album_id, count_photo)
+        print(f"Фотографии альбома '{self.album_id}' размера "
+              f"'{format_size_policy(self.size_policy)}' передаются на "
+              f"сохранение по мере получения.")
+        return photos_list
+
+    def get_album_photos(self, album_id, count_photo=ALL_PHOTOS):
+        """
+        Получение списка фотографий альбома без пользовательского ввода.
+        :param album_id: ID альбома VK.
+        :param count_photo: Количество фотографий для загрузки.
+        :return: Список json данных по каждой фотографии.
+        """
+        self.set_album_id(album_id)
         self.set_count_photo(count_photo)
         # получение списка фотографий максимального размера,
         # если ID альбома и количество для загрузки корректны
         photos_list = self.get_max_photos(self.get_photos_info())
         return photos_list
 
+    def iter_album_photos(self, album_id, count_photo=ALL_PHOTOS):
+        """
+        Потоковое получение фотографий альбома: записи о фотографиях
+        отдаются по мере получения страниц от VK API.
+        :param album_id: ID альбома VK.
+        :param count_photo: Количество фотографий для загрузки.
+        :return: Генератор записей Photo.
+        """
+        self.set_album_id(album_id)
+        self.set_count_photo(count_photo)
+        items = (item for page in self.iter_photos_pages()
+                 for item in page['items'])
+        return iter_max_photos(items, self.size_policy)
+
+    def get_albums(self, use_cache=True):
+        """
+        Получение всех альбомов пользователя, включая системные, с
+        количеством фотографий и временем последнего изменения.
+        Системные альбомы, фотографии которых photos.get не отдает,
+        пропускаются.
+        :param use_cache: Брать ответ из кэша, если он там есть.
+        :return: Список словарей с ключами 'id', 'size' и 'updated'
+                 (у системных альбомов времени изменения нет - None).
+        """
+        albums = []
+        for album in self.get_albums_info(use_cache)['response']['items']:
+            album_id = check_album_id(album['id'])
+            if isinstance(album_id, int) and album_id < 0:
+                print(f"Системный альбом '{album_id}' не поддерживается, "
+                      f"пропускается.")
+                continue
+            albums.append({'id': album_id,
+                           'size': album.get('size'),
+                           'updated': album.get('updated')})
+        return albums
+
 
 def available_albums(response):
     """
@@ -181,8 +400,24 @@ def available_albums(response):
                       'title': album['title'],
                       }
         albums_list.append(album_date)
-    df = pd.DataFrame(albums_list)
-    print(df)
+    print(format_table(albums_list, ['id', 'size', 'title']))
+
+
+def format_table(rows, columns):
+    """
+    Форматирование списка словарей в текстовую таблицу с номерами строк.
+    :param rows: Список словарей с данными.
+    :param columns: Список названий столбцов.
+    :return: Строка с таблицей.
+    """
+    table = [[''] + columns]
+    table += [[str(number)] + [str(row.get(column, '')) for column in columns]
+              for number, row in enumerate(rows)]
+    widths = [max(len(line[i]) for line in table)
+              for i in range(len(table[0]))]
+    return '\n'.join(
+        '  '.join(cell.rjust(width) for cell, width in zip(line, widths))
+        for line in table)
 
 
 def check_album_id(album_id):
@@ -195,16 +430,11 @@ def check_album_id(album_id):
         # если пользователь не ввел никаких данных
         if not album_id:
             return DEFAULT_ALBUM_ID
-        # ID альбома '-6' - фотографии профиля
-        if album_id == -6:
-            return 'profile'
-        # ID альбома '-7' - фотографии со стены
-        if album_id == -7:
-            return 'wall'
-        return album_id
+        # ID системных альбомов: '-6' - фотографии профиля,
+        # '-7' - фотографии со стены, '-15' - сохраненные фотографии
+        return SYSTEM_ALBUM_IDS.get(album_id, album_id)
     except ValueError:
-        print("Ошибка получения ID альбома.")
-        exit()
+        raise VKError("Ошибка получения ID альбома.")
 
 
 def check_count(count):
@@ -217,26 +447,157 @@ def check_count(count):
         # если пользователь не ввел никаких данных
         if not count:
             return DEFAULT_COUNT
+        # загрузка всех фотографий альбома
+        if str(count).lower() in {ALL_PHOTOS, 'все'}:
+            return ALL_PHOTOS
         count = int(count)
         if count > 0:
             return count
         raise ValueError
     except ValueError:
-        print("Ошибка получения количества фотографий.")
-        exit()
+        raise VKError("Ошибка получения количества фотографий.")
+
+
+def check_size_policy(size_policy):
+    """
+    Проверка политики выбора размера фотографий.
+    :param size_policy: Политика: 'max' - самый большой размер,
+                        'cap:N' - самый большой, у которого большая сторона
+                        не больше N пикселей, 'type:X' - размер типа X
+                        (s, m, x, y, z, w...), 'min:N' - самый маленький,
+                        у которого большая сторона не меньше N пикселей.
+    :return: Пара (вид политики, значение).
+    """
+    if not size_policy or size_policy == SIZE_POLICY_MAX:
+        return SIZE_POLICY_MAX, None
+    kind, _, value = str(size_policy).partition(':')
+    if kind == SIZE_POLICY_TYPE and len(value) == 1 and value.isalpha():
+        return kind, value
+    if kind in {SIZE_POLICY_CAP, SIZE_POLICY_MIN} and value.isdigit() \
+            and int(value) > 0:
+        return kind, int(value)
+    raise VKError("Политика размера должна быть 'max', 'cap:N', "
+                  "'type:X' или 'min:N'.")
+
+
+def format_size_policy(size_policy):
+    """
+    Запись политики выбора размера в виде строки.
+    :param size_policy: Пара (вид политики, значение).
+    :return: Строка вида 'max' или 'cap:1280'.
+    """
+    kind, value = size_policy
+    return kind if value is None else f"{kind}:{value}"
+
+
+def is_rate_limited(response):
+    """
+    Проверка ответа VK API на ошибку превышения частоты запросов.
+    :param response: Объект ответа requests.Response.
+    :return: True, если запрос нужно повторить.
+    """
+    try:
+        error = response.json().get('error')
+    except ValueError:
+        return False
+    return bool(error) and error.get('error_code') in RATE_LIMIT_ERRORS
+
+
+def iter_max_photos(items, size_policy=(SIZE_POLICY_MAX, None)):
+    """
+    Генератор записей о фотографиях размера, выбранного политикой.
+    :param items: Фотографии альбома из ответа photos.get.
+    :param size_policy: Пара (вид политики, значение),
+                        по умолчанию - максимальный размер.
+    :return: Генератор записей Photo.
+    """
+    used_names = set()
+    # проход по каждой фотографии в альбоме
+    for photos in items:
+        url_max_photo, max_size_type = select_size(photos['sizes'],
+                                                   size_policy)
+        # Информация каждой отдельной фотографии выбранного размера
+        yield Photo(url_max_photo,
+                    photos['id'],
+                    max_size_type,
+                    check_name(photos['likes']['count'],
+                               photos['id'],
+                               used_names),
+                    photos['likes']['count'])
+
+
+def select_size(sizes, size_policy):
+    """
+    Выбор размера фотографии по политике. Если подходящего размера нет,
+    берется максимальный размер ('cap:N' - минимальный из известных).
+    :param sizes: Список размеров фотографии.
+    :param size_policy: Пара (вид политики, значение).
+    :return: Пара (URL фотографии, тип размера).
+    """
+    kind, value = size_policy
+    if kind == SIZE_POLICY_MAX:
+        return select_max_size(sizes)
+    if kind == SIZE_POLICY_TYPE:
+        for photo in sizes:
+            if photo['type'] == value:
+                return photo['url'], photo['type']
+        return select_max_size(sizes)
+    # размеры с нулевой высотой не имеют известных размеров в пикселях
+    known = sorted((max(photo['width'], photo['height']), index)
+                   for index, photo in enumerate(sizes)
+                   if photo['height'] != 0)
+    if kind == SIZE_POLICY_CAP:
+        fitting = [index for side, index in known if side <= value]
+        if fitting:
+            photo = sizes[fitting[-1]]
+        elif known:
+            photo = sizes[known[0][1]]
+        else:
+            return select_max_size(sizes)
+        return photo['url'], photo['type']
+    for side, index in known:
+        if side >= value:
+            return sizes[index]['url'], sizes[index]['type']
+    return select_max_size(sizes)
+
+
+def select_max_size(sizes):
+    """
+    Выбор фотографии максимального размера.
+    :param sizes: Список размеров фотографии.
+    :return: Пара (URL фотографии, тип размера).
+    """
+    max_height = 0
+    max_size_type = ''
+    url_max_photo = ''
+    # проход по каждому размеру отдельной фотографии
+    for photo in sizes:
+        # в файле встречаются размеры с 0 высотой, в таком случае
+        # берется последняя фотография в списке
+        if photo['height'] != 0:
+            if photo['height'] > max_height:
+                max_height = photo['height']
+                url_max_photo = photo['url']
+                max_size_type = photo['type']
+        else:
+            url_max_photo = photo['url']
+            max_size_type = photo['type']
+    return url_max_photo, max_size_type
 
 
-def check_name(name, photo_id,photos_list):
+def check_name(name, photo_id, used_names):
     """
     Установка имени фотографии, а также проверка на дублирование.
     :param name: Имя для проверки.
-    :param photos_list: Список имеющихся фотографий.
+    :param photo_id: ID фотографии для имени при совпадении.
+    :param used_names: Множество уже занятых имен (без расширения),
+                       пополняется новым именем.
     :return: Имя фотографии.
     """
-    for photo_name in photos_list:
-        file_name = photo_name['file_name'].split('.')[0]
-        if str(name) == file_name:
-            return f"{name}-{photo_id}.jpg"
+    name = str(name)
+    if name in used_names:
+        name = f"{name}-{photo_id}"
+    used_names.add(name)
     return f"{name}.jpg"
 
 
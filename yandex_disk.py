@@ -1,18 +1,101 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 import requests
 from tqdm import tqdm
 
+from dedupe import hash_stream
+from http_client import (ApiError, HttpError, AdaptiveLimiter, MAX_RETRIES,
+                         get_backoff, get_client)
+from metrics import get_metrics, log_photo
+from pipeline import run_pipeline
+from sync_state import TARGET_YANDEX
+
+API_URL = "https://cloud-api.yandex.net/v1/disk"
+# количество файлов в одной странице листинга папки
+INDEX_PAGE_SIZE = 1000
+# количество одновременных запросов проверки операций
+UPLOAD_WORKERS = 8
+# количество фотографий, которые отправляются и проверяются за один проход:
+# память на сведения об операциях не растет с размером альбома
+LOAD_WINDOW = 1000
+# пределы количества одновременных запросов на загрузку: оно
+# подстраивается под ответы Яндекс.Диска
+UPLOAD_CONCURRENCY_INITIAL = 4
+UPLOAD_CONCURRENCY_MAX = 32
+# ответы, при которых количество одновременных загрузок уменьшается
+THROTTLE_STATUSES = {429, 503}
+# параметры опроса статуса асинхронных операций (в секундах)
+POLL_INITIAL_DELAY = 0.5
+POLL_MAX_DELAY = 8
+POLL_TIMEOUT = 120
+# режимы загрузки: по URL силами Яндекс.Диска, ретрансляция через
+# программу или по URL с ретрансляцией неудавшихся загрузок
+UPLOAD_MODE_URL = 'url'
+UPLOAD_MODE_RELAY = 'relay'
+UPLOAD_MODE_AUTO = 'auto'
+UPLOAD_MODES = (UPLOAD_MODE_AUTO, UPLOAD_MODE_URL, UPLOAD_MODE_RELAY)
+# количество одновременных ретрансляций и размер блока одной передачи
+RELAY_WORKERS = 4
+RELAY_CHUNK_SIZE = 64 * 1024
+# количество попыток ретрансляции одной фотографии
+RELAY_ATTEMPTS = 2
+# размер буфера в памяти для фотографии, которая проверяется по индексу
+# содержимого до отправки, фотографии больше него буферизуются в файле
+RELAY_SPOOL_SIZE = 2 ** 20
+# количество блокировок проверки содержимого: фотографии с одинаковым
+# хэшем проверяются и отправляются по очереди
+CONTENT_LOCKS = 64
+
+
+class YandexDiskError(ApiError):
+    """Ошибка при обращении к API Яндекс.Диска."""
 
 
 class YandexDisk:
 
-    def __init__(self, token):
+    def __init__(self, token, client=None, dedupe=None, api_url=API_URL,
+                 upload_mode=UPLOAD_MODE_AUTO, limiter=None):
         """
         Инициализация объекта класса YandexDisk для использования API.
         :param token: Токен API Яндекс.Диска.
+        :param client: HTTP клиент, по умолчанию - общий клиент.
+        :param dedupe: Индекс содержимого DedupeIndex: одинаковые
+                       фотографии копируются на стороне Яндекс.Диска.
+        :param api_url: Адрес API Яндекс.Диска.
+        :param upload_mode: Режим загрузки: 'url' - Яндекс.Диск скачивает
+                            фотографию сам, 'relay' - фотография передается
+                            через программу без сохранения на диск,
+                            'auto' - по URL, а неудавшиеся загрузки
+                            повторяются ретрансляцией.
+        :param limiter: Ограничитель одновременных загрузок AdaptiveLimiter,
+                        по умолчанию - общий для всех альбомов.
         :return: None.
         """
+        if upload_mode not in UPLOAD_MODES:
+            raise ValueError(f"Неизвестный режим загрузки: {upload_mode}")
         self.token = token
         self.headers = {'Authorization': self.token}
+        self.client = client or get_client()
+        self.dedupe = dedupe
+        self.api_url = api_url
+        self.upload_mode = upload_mode
+        self.limiter = limiter or get_upload_limiter()
+        # ограничение одновременных ретрансляций: память на каждую
+        # передачу ограничена одним блоком
+        self.relay_slots = threading.BoundedSemaphore(RELAY_WORKERS)
+        self.content_locks = [threading.Lock()
+                              for _ in range(CONTENT_LOCKS)]
+        # индекс файлов в папке альбома на Яндекс.Диске
+        # {имя файла: размер в байтах или None, если он неизвестен}
+        self.folder_index = {}
+        # время отправки фотографий на загрузку {имя файла: время}
+        self.started = {}
 
     def get_user_info(self):
         """
@@ -20,15 +103,11 @@ class YandexDisk:
         :return: Статус код об информации о пользователе:
                  200 - информация получена.
         """
-        url = "https://cloud-api.yandex.net/v1/disk"
-        try:
-            response = requests.get(url, headers={**self.headers})
-            if response.status_code == 200:
-                return response.status_code
-            raise ValueError
-        except ValueError:
-            print("Ошибка токена API Яндекс.Диска.")
-            exit()
+        url = self.api_url
+        response = self.client.get(url, headers={**self.headers})
+        if response.status_code == 200:
+            return response.status_code
+        raise YandexDiskError("Ошибка токена API Яндекс.Диска.")
 
     def create_folder(self, user_id, album_id):
         """
@@ -39,24 +118,16 @@ class YandexDisk:
                 201 - папка создана.
                 409 - папка уже существует.
         """
-        url = 'https://cloud-api.yandex.net/v1/disk/resources'
+        url = f"{self.api_url}/resources"
         path_user = f"{user_id}/"
         path_album = f"{user_id}/{album_id}"
-        try:
-            params = {'path': path_user}
-            response = requests.put(url, params=params,
-                                    headers={**self.headers})
-            if response.status_code not in {201, 409}:
-                raise Exception
-            params = {'path': path_album}
-            response = requests.put(url, params=params,
-                                    headers={**self.headers})
+        for path in (path_user, path_album):
+            params = {'path': path}
+            response = self.client.put(url, params=params,
+                                       headers={**self.headers})
             if response.status_code not in {201, 409}:
-                raise Exception
-            print("Папка на Яндекс.Диске создана.")
-        except Exception:
-            print("Ошибка создания папки.")
-            exit()
+                raise YandexDiskError("Ошибка создания папки.")
+        print("Папка на Яндекс.Диске создана.")
 
     def check_photo(self, path):
         """
@@ -66,101 +137,619 @@ class YandexDisk:
                  200 - фотография есть в Яндекс.Диске.
                  404 - фотография отсутствует.
         """
-        url = "https://cloud-api.yandex.net/v1/disk/resources"
+        url = f"{self.api_url}/resources"
         params = {'path': path}
         try:
-            response = requests.get(url, params=params,
-                                    headers={**self.headers})
+            response = self.client.get(url, params=params,
+                                       headers={**self.headers})
             if response.status_code not in {200, 404}:
-                raise Exception
+                raise YandexDiskError
             return response.status_code
-        except Exception:
-            print("Не удалось получить информацию о фотографии на Яндекс.Диске")
+        except (ApiError, ValueError, KeyError):
+            log_photo(f"Не удалось получить информацию о фотографии "
+                      f"{path} на Яндекс.Диске.")
+
+    def refresh_folder_index(self, user_id, album_id):
+        """
+        Обновление индекса файлов в папке альбома на Яндекс.Диске.
+        Листинг папки запрашивается постранично с сокращенным набором полей.
+        :param user_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :return: Словарь {имя файла: размер в байтах} файлов в папке.
+        """
+        url = f"{self.api_url}/resources"
+        names = {}
+        offset = 0
+        try:
+            with get_metrics().phase('yandex_existence'):
+                while True:
+                    params = {'path': f"{user_id}/{album_id}",
+                              'limit': INDEX_PAGE_SIZE,
+                              'offset': offset,
+                              'fields': '_embedded.items.name,'
+                                        '_embedded.items.size,'
+                                        '_embedded.total',
+                              }
+                    response = self.client.get(url, params=params,
+                                               headers={**self.headers})
+                    # папка еще не создана
+                    if response.status_code == 404:
+                        break
+                    if response.status_code != 200:
+                        raise YandexDiskError
+                    embedded = response.json()['_embedded']
+                    names.update((item['name'], item.get('size'))
+                                 for item in embedded['items'])
+                    offset += INDEX_PAGE_SIZE
+                    if offset >= embedded['total'] or not embedded['items']:
+                        break
+        except (ApiError, ValueError, KeyError):
+            print("Не удалось получить список файлов на Яндекс.Диске")
+        self.folder_index = names
+        return self.folder_index
 
     def upload_photo(self, path_photo, url_upload):
         """
         Загрузка фотографии на Яндекс.Диск по URL.
         :param path_photo: Путь куда загрузить фотографию.
         :param url_upload: URL откуда брать фотографию.
-        :return: Статус код загрузки:
-                 202 - фотография загружена.
+        :return: Ссылка на асинхронную операцию загрузки
+                 или None, если загрузку не удалось начать.
         """
-        url = "https://cloud-api.yandex.net/v1/disk/resources/upload"
+        url = f"{self.api_url}/resources/upload"
         params = {'path': path_photo,
                   'url': url_upload,
                   }
         try:
-            response = requests.post(url, params=params,
-                                     headers={**self.headers})
+            response = self.post_upload(url, params)
             if response.status_code == 202:
-                return response.status_code
-            raise Exception
-        except Exception:
-            print("Ошибка загрузки фотографии на Яндекс.Диск.")
+                return response.json()['href']
+            raise YandexDiskError
+        except (ApiError, ValueError, KeyError):
+            log_photo(f"Ошибка загрузки фотографии {path_photo} "
+                      f"на Яндекс.Диск.")
 
-    def upload_all_photos(self, user_id, album_id, photos_list):
+    def post_upload(self, url, params):
         """
-        Загрузка всех фотографий из списка на Яндекс.Диск.
+        Запрос на загрузку в пределах количества одновременных загрузок.
+        Повторные попытки выполняются здесь, а не в HTTP клиенте, чтобы
+        каждый ответ учитывался ограничителем.
+        :param url: Адрес метода загрузки.
+        :param params: Параметры запроса.
+        :return: Ответ Яндекс.Диска.
+        """
+        attempt = 0
+        while True:
+            start = self.limiter.acquire()
+            try:
+                response = self.client.post(url, params=params,
+                                            headers={**self.headers},
+                                            max_retries=0)
+            except HttpError as error:
+                throttled = error.status_code in THROTTLE_STATUSES
+                self.limiter.release(start, throttled, error.retry_after,
+                                     failed=not throttled)
+                if attempt >= MAX_RETRIES:
+                    raise
+                if error.retry_after is None:
+                    time.sleep(get_backoff(attempt))
+            except ApiError:
+                self.limiter.release(start, failed=True)
+                if attempt >= MAX_RETRIES:
+                    raise
+                time.sleep(get_backoff(attempt))
+            else:
+                self.limiter.release(start)
+                return response
+            attempt += 1
+
+    def get_upload_href(self, path_photo, overwrite=False):
+        """
+        Получение ссылки для загрузки файла на Яндекс.Диск.
+        :param path_photo: Путь куда загрузить фотографию.
+        :param overwrite: Перезаписать файл, если он уже есть.
+        :return: Ссылка для загрузки файла методом PUT.
+        """
+        url = f"{self.api_url}/resources/upload"
+        params = {'path': path_photo}
+        if overwrite:
+            params['overwrite'] = 'true'
+        response = self.client.get(url, params=params,
+                                   headers={**self.headers})
+        if response.status_code != 200:
+            raise YandexDiskError(
+                "Не удалось получить ссылку для загрузки на Яндекс.Диск.")
+        return response.json()['href']
+
+    def relay_photo(self, path_photo, url_upload):
+        """
+        Ретрансляция фотографии с сервера VK на Яндекс.Диск без сохранения
+        на диск: фотография передается блоками по мере скачивания.
+        :param path_photo: Путь куда загрузить фотографию.
+        :param url_upload: URL откуда брать фотографию.
+        :return: Пара (хэш SHA-256 содержимого, размер в байтах), если
+                 фотография загружена, иначе None.
+        """
+        hasher, size = None, 0
+
+        def hashed(chunks):
+            # хэш содержимого считается по ходу передачи
+            nonlocal size
+            for chunk in chunks:
+                hasher.update(chunk)
+                size += len(chunk)
+                yield chunk
+
+        with self.relay_slots:
+            for _ in range(RELAY_ATTEMPTS):
+                hasher, size = hashlib.sha256(), 0
+                try:
+                    href = self.get_upload_href(path_photo)
+                    with self.client.get(url_upload, stream=True) as source:
+                        source.raise_for_status()
+                        # потоковое тело нельзя отправить повторно,
+                        # при ошибке повторяется вся ретрансляция
+                        response = self.client.put(
+                            href, data=self.count_upload(hashed(
+                                source.iter_content(RELAY_CHUNK_SIZE))),
+                            max_retries=0)
+                    if response.status_code in {201, 202}:
+                        return hasher.hexdigest(), size
+                except (ApiError, ValueError, KeyError,
+                        requests.RequestException):
+                    pass
+        log_photo(f"Ошибка ретрансляции фотографии {path_photo} "
+                  f"на Яндекс.Диск.")
+        return None
+
+    def upload_file(self, path_photo, file_path, overwrite=False):
+        """
+        Загрузка фотографии на Яндекс.Диск из файла на компьютере.
+        :param path_photo: Путь куда загрузить фотографию.
+        :param file_path: Путь к файлу на компьютере.
+        :param overwrite: Перезаписать файл, если он уже есть.
+        :return: True, если фотография загружена, иначе False.
+        """
+        try:
+            href = self.get_upload_href(path_photo, overwrite)
+            with open(file_path, 'rb') as file:
+                # файл читается при отправке, повторная отправка
+                # выполняется только с новой ссылкой
+                response = self.client.put(href, data=file, max_retries=0)
+            if response.status_code in {201, 202}:
+                get_metrics().add_bytes('upload', os.path.getsize(file_path))
+                return True
+        except (ApiError, ValueError, KeyError, OSError,
+                requests.RequestException):
+            pass
+        return False
+
+    @staticmethod
+    def count_upload(chunks):
+        """
+        Учет отправленных на Яндекс.Диск байт.
+        :param chunks: Поток блоков данных.
+        :return: Генератор тех же блоков.
+        """
+        metrics = get_metrics()
+        for chunk in chunks:
+            metrics.add_bytes('upload', len(chunk))
+            yield chunk
+
+    def relay_failed(self, user_id, album_id, photos_list, statuses):
+        """
+        Ретрансляция фотографий, которые Яндекс.Диск не смог скачать по URL.
         :param user_id: ID пользователя VK.
         :param album_id: ID альбома VK.
-        :param photos_list: Список фотографий для загрузки.
-        :return: None.
+        :param photos_list: Список отправленных фотографий.
+        :param statuses: Словарь {имя файла: статус операции загрузки}.
+        :return: Словарь статусов с результатами ретрансляции.
+        """
+        failed = [photo for photo in photos_list
+                  if statuses.get(photo['file_name']) == 'failed']
+        if not failed:
+            return statuses
+        print(f"Ретрансляция {len(failed)} фотографий, "
+              f"не загруженных по URL...")
+        with ThreadPoolExecutor(max_workers=RELAY_WORKERS) as executor:
+            results = executor.map(
+                lambda photo: self.relay_new(
+                    photo, f"{user_id}/{album_id}/{photo['file_name']}"),
+                failed)
+            copies = {}
+            for photo, result in zip(failed, results):
+                if result is False:
+                    statuses[photo['file_name']] = 'success'
+                elif result:
+                    copies[photo['file_name']] = result
+        if copies:
+            statuses.update(self.wait_operations(copies))
+        return statuses
+
+    def relay_new(self, photo, path_photo):
+        """
+        Ретрансляция фотографии, с проверкой содержимого по индексу,
+        если включена дедупликация.
+        :param photo: Запись о фотографии.
+        :param path_photo: Путь куда загрузить фотографию.
+        :return: Результат как у submit_photo.
+        """
+        if self.dedupe is not None:
+            return self.relay_unique(photo, path_photo)
+        relayed = self.relay_photo(path_photo, photo['url'])
+        if relayed is None:
+            return None
+        self.folder_index[photo['file_name']] = relayed[1]
+        return False
+
+    def relay_unique(self, photo, path_photo):
+        """
+        Ретрансляция фотографии с проверкой содержимого до отправки:
+        фотография скачивается в буфер с вычислением хэша, и если такое
+        содержимое уже есть на Яндекс.Диске, вместо отправки создается
+        копия на стороне сервера.
+        :param photo: Запись о фотографии.
+        :param path_photo: Путь куда загрузить фотографию.
+        :return: Результат как у submit_photo.
+        """
+
+        def buffered(chunks, buffer):
+            for chunk in chunks:
+                buffer.write(chunk)
+                yield chunk
+
+        with self.relay_slots:
+            for _ in range(RELAY_ATTEMPTS):
+                try:
+                    with tempfile.SpooledTemporaryFile(
+                            RELAY_SPOOL_SIZE) as buffer:
+                        with self.client.get(photo['url'],
+                                             stream=True) as source:
+                            source.raise_for_status()
+                            # хэш считается по ходу записи в буфер
+                            digest, size = hash_stream(buffered(
+                                source.iter_content(RELAY_CHUNK_SIZE),
+                                buffer))
+                        self.dedupe.remember_url(photo['url'], digest, size)
+                        with self.content_locks[
+                                int(digest[:8], 16) % CONTENT_LOCKS]:
+                            result = self.copy_known(digest, size,
+                                                     path_photo,
+                                                     transferred=True)
+                            if result is None:
+                                buffer.seek(0)
+                                result = self.put_buffer(path_photo, buffer)
+                                if result:
+                                    self.dedupe.add(TARGET_YANDEX, digest,
+                                                    path_photo, size)
+                    if result is True:
+                        self.folder_index[photo['file_name']] = size
+                        return False
+                    if result:
+                        return result
+                except (ApiError, ValueError, KeyError, OSError,
+                        requests.RequestException):
+                    pass
+        log_photo(f"Ошибка ретрансляции фотографии {path_photo} "
+                  f"на Яндекс.Диск.")
+        return None
+
+    def put_buffer(self, path_photo, buffer):
+        """
+        Отправка фотографии из буфера по ссылке загрузки.
+        :param path_photo: Путь куда загрузить фотографию.
+        :param buffer: Файловый объект с фотографией.
+        :return: True, если фотография загружена, иначе None.
+        """
+        href = self.get_upload_href(path_photo)
+        response = self.client.put(
+            href, data=self.count_upload(iter(
+                lambda: buffer.read(RELAY_CHUNK_SIZE), b'')),
+            max_retries=0)
+        if response.status_code in {201, 202}:
+            return True
+        return None
+
+    def copy_photo(self, path_from, path_photo):
+        """
+        Копирование файла на стороне Яндекс.Диска.
+        :param path_from: Путь к существующей фотографии.
+        :param path_photo: Путь куда скопировать фотографию.
+        :return: Ссылка на асинхронную операцию копирования,
+                 True, если копия создана сразу,
+                 или None, если скопировать не удалось.
+        """
+        url = f"{self.api_url}/resources/copy"
+        params = {'from': path_from,
+                  'path': path_photo,
+                  }
+        try:
+            response = self.client.post(url, params=params,
+                                        headers={**self.headers})
+            if response.status_code == 201:
+                return True
+            if response.status_code == 202:
+                return response.json()['href']
+        except (ApiError, ValueError, KeyError):
+            pass
+        return None
+
+    def copy_known(self, digest, size, path_photo, transferred=False):
+        """
+        Копирование на стороне Яндекс.Диска фотографии с таким же
+        содержимым, если она уже загружена.
+        :param digest: Хэш содержимого.
+        :param size: Размер фотографии в байтах.
+        :param path_photo: Путь куда скопировать фотографию.
+        :param transferred: True, если фотография уже скачана из VK.
+        :return: Результат как у copy_photo или None, если копии нет.
+        """
+        found = self.dedupe.lookup(TARGET_YANDEX, digest)
+        if found is None or found[0] == path_photo:
+            return None
+        result = self.copy_photo(found[0], path_photo)
+        if result is not None:
+            self.dedupe.count_copy(size, transferred)
+        return result
+
+    def submit_copy(self, photo, path_photo):
         """
-        for photo in tqdm(
-                photos_list,
-                desc="Отправка фотографий на Яндекс.Диск",):
-            path_photo = f"{user_id}/{album_id}/{photo['file_name']}"
-            # проверка на существование фотографии
-            if self.check_photo(path_photo) == 404:
-                self.upload_photo(path_photo, photo['url'])
+        Сохранение фотографии копией уже загруженной фотографии
+        с таким же содержимым, если содержимое фотографии известно
+        по ее URL (фотография уже проходила через программу).
+        :param photo: Запись о фотографии.
+        :param path_photo: Путь куда загрузить фотографию.
+        :return: Результат как у submit_photo или None, если фотографию
+                 нужно загрузить.
+        """
+        known = self.dedupe.lookup_url(photo['url'])
+        if known is None:
+            return None
+        digest, size = known
+        result = self.copy_known(digest, size, path_photo)
+        if result is None:
+            if self.upload_mode != UPLOAD_MODE_RELAY:
+                # загрузка будет выполнена по URL, путь запоминается
+                # для копий
+                self.dedupe.add(TARGET_YANDEX, digest, path_photo, size)
+            return None
+        if result is True:
+            self.folder_index[photo['file_name']] = size
+            return False
+        return result
+
+    def get_operation_status(self, href):
+        """
+        Получение статуса асинхронной операции на Яндекс.Диске.
+        :param href: Ссылка на операцию.
+        :return: Статус операции:
+                 'success' - операция завершена успешно.
+                 'failed' - операция завершилась ошибкой.
+                 'pending' - операция еще выполняется.
+        """
+        try:
+            response = self.client.get(href, headers={**self.headers})
+            if response.status_code != 200:
+                raise YandexDiskError
+            status = response.json()['status']
+            if status in {'success', 'failed'}:
+                return status
+        except (ApiError, ValueError, KeyError):
+            pass
+        return 'pending'
 
-    def check_successful_downloads(self, user_id, album_id, photos_list):
+    def wait_operations(self, operations):
+        """
+        Параллельный опрос статусов операций загрузки с нарастающей паузой.
+        :param operations: Словарь {имя файла: ссылка на операцию}.
+        :return: Словарь {имя файла: статус} со статусами
+                 'success', 'failed' или 'pending'.
+        """
+        statuses = {name: 'pending' if href else 'failed'
+                    for name, href in operations.items()}
+        pending = [name for name, status in statuses.items()
+                   if status == 'pending']
+        delay = POLL_INITIAL_DELAY
+        deadline = time.monotonic() + POLL_TIMEOUT
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            while pending and time.monotonic() < deadline:
+                time.sleep(delay)
+                results = executor.map(
+                    self.get_operation_status,
+                    [operations[name] for name in pending])
+                for name, status in zip(pending, results):
+                    statuses[name] = status
+                pending = [name for name in pending
+                           if statuses[name] == 'pending']
+                delay = min(delay * 2, POLL_MAX_DELAY)
+        return statuses
+
+    def submit_photo(self, user_id, album_id, photo):
+        """
+        Отправка фотографии на загрузку, если ее еще нет на Яндекс.Диске.
+        :param user_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param photo: Запись о фотографии.
+        :return: Ссылка на операцию загрузки, None при ошибке
+                 или False, если фотография уже есть на диске
+                 (скопирована или ретранслирована сразу).
+        """
+        # проверка на существование фотографии
+        if photo['file_name'] in self.folder_index:
+            return False
+        path_photo = f"{user_id}/{album_id}/{photo['file_name']}"
+        if self.dedupe is not None:
+            result = self.submit_copy(photo, path_photo)
+            if result is not None:
+                return result
+        if self.upload_mode == UPLOAD_MODE_RELAY:
+            return self.relay_new(photo, path_photo)
+        return self.upload_photo(path_photo, photo['url'])
+
+    def upload_all_photos(self, user_id, album_id, photos_list,
+                          manifest=None, refresh_index=True):
+        """
+        Параллельная загрузка всех фотографий из списка на Яндекс.Диск.
+        Отправка начинается с первой полученной фотографии, не дожидаясь
+        окончания списка.
+        :param user_id: ID пользователя VK.
+        :param album_id: ID альбома VK.
+        :param photos_list: Список или генератор фотографий для загрузки.
+        :param manifest: Журнал сохранения Manifest: отправленные фотографии
+                         записываются со статусом 'pending'.
+        :param refresh_index: Обновить индекс файлов папки альбома перед
+                              отправкой.
+        :return: Пара (список обработанных фотографий,
+                 словарь {имя файла: ссылка на операцию загрузки}
+                 для отправленных фотографий).
+        """
+        if refresh_index:
+            self.refresh_folder_index(user_id, album_id)
+        processed = []
+        operations = {}
+        self.started = {}
+
+        def submit(photo):
+            self.started[photo['file_name']] = time.monotonic()
+            return self.submit_photo(user_id, album_id, photo)
+
+        with get_metrics().phase('yandex_upload'):
+            for photo, href in tqdm(
+                    run_pipeline(photos_list, submit,
+                                 self.limiter.maximum),
+                    desc="Отправка фотографий на Яндекс.Диск",
+                    disable=get_metrics().quiet):
+                processed.append(photo)
+                if href is not False:
+                    operations[photo['file_name']] = href
+                    if manifest is not None:
+                        manifest.write(
+                            TARGET_YANDEX, photo,
+                            'pending' if href else 'failed',
+                            seconds=self.get_elapsed(photo))
+        return processed, operations
+
+    def get_elapsed(self, photo):
+        """
+        Время с отправки фотографии на загрузку.
+        :param photo: Запись о фотографии.
+        :return: Время в секундах или None, если фотография не отправлялась.
+        """
+        started = self.started.get(photo['file_name'])
+        return time.monotonic() - started if started is not None else None
+
+    def check_successful_downloads(self, user_id, album_id, photos_list,
+                                   statuses=None, manifest=None, state=None,
+                                   first_number=1):
         """
         Проверка загруженных фотографий.
         :param user_id: ID пользователя VK.
         :param album_id: ID альбома VK.
         :param photos_list: Список фотографий для загрузки.
-        :return: Список загруженных фотографий.
+        :param statuses: Словарь {имя файла: статус операции загрузки}.
+                         Фотографии без статуса проверяются по списку файлов
+                         в папке на Яндекс.Диске.
+        :param manifest: Журнал сохранения Manifest для итоговых статусов.
+        :param state: Объект SyncState: результат каждой фотографии
+                      записывается сразу.
+        :param first_number: Номер первой фотографии в сообщениях.
+        :return: Количество загруженных фотографий.
         """
-        uploaded_list = []  # список для записи в json
-        count_files = 1  # счетчик фотографий
+        count_files = first_number  # счетчик фотографий
         uploaded_files = 0  # количество загруженных фотографий
+        if statuses is None:
+            statuses = {}
+            self.refresh_folder_index(user_id, album_id)
         for photo in photos_list:
-            # проверка появилось фото ли после загрузки
-            path_photo = f"{user_id}/{album_id}/{photo['file_name']}"
-            if self.check_photo(path_photo) == 200:
-                photo_info = {
-                    "file_name": photo['file_name'],
-                    "size": photo['type'],
-                }
+            status = statuses.get(photo['file_name'])
+            if status is None:
+                # фотография уже была на диске или статус неизвестен
+                status = ('success' if photo['file_name'] in self.folder_index
+                          else 'failed')
+            if manifest is not None:
+                manifest.write(TARGET_YANDEX, photo, status,
+                               self.folder_index.get(photo['file_name'])
+                               if status == 'success' else None,
+                               self.get_elapsed(photo))
+            if state is not None:
+                state.record(user_id, album_id, TARGET_YANDEX,
+                             [(photo, 'success' if status == 'success'
+                               else 'failed')])
+            if status == 'success':
                 uploaded_files += 1
-                uploaded_list.append(photo_info)
-                print(f"Фотография №{count_files}"
-                      f" - {photo['file_name']} загружено.")
+                log_photo(f"Фотография №{count_files}"
+                          f" - {photo['file_name']} загружено.")
+            elif status == 'pending':
+                log_photo(f"Фотография №{count_files}"
+                          f" - {photo['file_name']} еще загружается.")
             else:
-                print(f"Фотография №{count_files}"
-                      f" - {photo['file_name']} не удалось загрузить.")
+                log_photo(f"Фотография №{count_files}"
+                          f" - {photo['file_name']} не удалось загрузить.")
             count_files += 1
-        print(f"Загружено {uploaded_files} из {len(photos_list)} фотографий.")
-        return uploaded_list
+        return uploaded_files
 
-    def load_photos(self, user_id, album_id, photos_list):
+    def load_photos(self, user_id, album_id, photos_list, manifest=None,
+                    state=None):
         """
         Загрузка всех фотографий из списка на Яндекс.Диск.
+        Фотографии отправляются и проверяются частями по LOAD_WINDOW штук.
         :param user_id: ID пользователя ВК.
         :param album_id: ID альбома ВК.
-        :param photos_list: Список фотографий для загрузки.
-        :return Список загруженных фотографий.
+        :param photos_list: Список или генератор фотографий для загрузки.
+        :param manifest: Журнал сохранения Manifest.
+        :param state: Объект SyncState: результат каждой фотографии
+                      записывается сразу после проверки.
+        :return Пара (количество загруженных фотографий,
+                количество обработанных фотографий).
         """
         self.get_user_info()
         print(f"Идет процесс загрузки фотографий на Яндекс.Диск...")
         self.create_folder(user_id, album_id)
-        self.upload_all_photos(user_id, album_id, photos_list)
-        uploaded_list = self.check_successful_downloads(
-            user_id,
-            album_id,
-            photos_list)
-        return uploaded_list
+        photos_iter = iter(photos_list)
+        uploaded_files = 0
+        processed_files = 0
+        while True:
+            window, operations = self.upload_all_photos(
+                user_id, album_id, islice(photos_iter, LOAD_WINDOW),
+                manifest, refresh_index=not processed_files)
+            if not window:
+                break
+            with get_metrics().phase('yandex_verification'):
+                statuses = self.wait_operations(operations)
+            if self.upload_mode == UPLOAD_MODE_AUTO:
+                with get_metrics().phase('yandex_relay'):
+                    statuses = self.relay_failed(user_id, album_id, window,
+                                                 statuses)
+            if any(status == 'success' and name not in self.folder_index
+                   for name, status in statuses.items()):
+                # размеры фотографий, загруженных Яндекс.Диском по URL,
+                # берутся из листинга папки
+                self.refresh_folder_index(user_id, album_id)
+            with get_metrics().phase('yandex_verification'):
+                uploaded_files += self.check_successful_downloads(
+                    user_id,
+                    album_id,
+                    window,
+                    statuses,
+                    manifest,
+                    state,
+                    processed_files + 1)
+            processed_files += len(window)
+        print(f"Загружено {uploaded_files} из {processed_files} фотографий.")
+        return uploaded_files, processed_files
+
+
+_upload_limiter = AdaptiveLimiter("Загрузка на Яндекс.Диск",
+                                  initial=UPLOAD_CONCURRENCY_INITIAL,
+                                  maximum=UPLOAD_CONCURRENCY_MAX)
+
+
+def get_upload_limiter():
+    """
+    Получение общего ограничителя одновременных загрузок на Яндекс.Диск.
+    :return: Объект AdaptiveLimiter.
+    """
+    return _upload_limiter
 
 
 def main():